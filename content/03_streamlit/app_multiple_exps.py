@@ -6,10 +6,14 @@ import streamlit as st
 import os
 import pandas as pd
 
-from model import Experiment, run_all_experiments, experiment_summary_frame
+from model import (Experiment, run_all_experiments, experiment_summary_frame,
+                   paired_difference_frame)
 
 INFO_1 = '**Execute multiple experiments in a batch**'
 INFO_2 = '### Upload a CSV containing input parameters.'
+
+# number of worker processes used to run experiments (-1 = all cores)
+N_JOBS = -1
     
 def create_experiments(df_experiments):
     '''
@@ -58,13 +62,22 @@ if uploaded_file is not None:
     # loop through scenarios, create and run model
     n_reps = st.slider('Replications', 3, 30, 5, step=1)
 
+    # common random numbers and paired comparison to a baseline
+    crn = st.checkbox('Use common random numbers', value=True,
+                      help='Every experiment uses the same random numbers '
+                      + 'so differences between experiments are clearer.')
+    baseline = st.selectbox('Baseline experiment', 
+                            df_experiments[df_experiments.columns[0]])
+
     if st.button('Execute Experiments'):
         # create the batch of experiments based on upload
         experiments = create_experiments(df_experiments) 
         print(experiments)
         with st.spinner('Running all experiments'):
             
-            results = run_all_experiments(experiments, n_reps=n_reps)
+            results = run_all_experiments(experiments, n_reps=n_reps,
+                                          n_jobs=N_JOBS,
+                                          common_random_numbers=crn)
             st.success('Done!')
             
             # combine results into a single summary table.
@@ -72,3 +85,6 @@ if uploaded_file is not None:
             # display in the app via table
             st.table(df_results.round(2))
 
+            # paired differences from the baseline experiment
+            st.write(f'**Difference from {baseline}**')
+            st.table(paired_difference_frame(results, baseline).round(2))
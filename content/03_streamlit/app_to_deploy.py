@@ -5,18 +5,43 @@ histogram can be selected by the user.
 """
 import streamlit as st
 
+import os
 import urllib.request as request
 
 # import graph_objects instead of plotly.express
 import plotly.graph_objects as go
-from model import Experiment, multiple_replications
+from model import RESULTS_COLLECTION_PERIOD
+from backends import AUTO, available_backends, get_backend, resolve_backend
+from results_cache import ResultsCache, experiment_key
+from jobs import CANCELLED, DONE, FAILED, JobQueue
+from lookup_table import LOOKUP_TABLE, LookupTable
+from metamodel import Metamodel
 
 INTRO_FILE = (
     "https://raw.githubusercontent.com/health-data-science-OR/"
     + "simpy-streamlit-tutorial/main/content/03_streamlit/resources/model_info.md"
 )
 
+# number of worker processes used to run replications (-1 = all cores)
+N_JOBS = -1
 
+# seconds between refreshes of the progress of a running simulation
+UPDATE_INTERVAL = 0.5
+
+# precomputed results of the sidebar grid (built with lookup_table.py)
+LOOKUP_TABLE_PATH = os.path.join(os.path.dirname(__file__), LOOKUP_TABLE)
+
+# engines whose results the lookup table can stand in for (the table is
+# built with the fast engine, which matches the simpy model).  'auto' uses
+# whichever engine is fastest, and a lookup is fastest of all.
+LOOKUP_ENGINES = (AUTO, "simpy", "fast")
+
+# backend whose cache key is checked before 'auto' runs its pilot (the simpy
+# and fast engines share cached results)
+CACHE_BACKEND = "fast"
+
+
+@st.cache_data
 def read_file_contents(path):
     """
     Download the content of a file from the GitHub Repo and return as a utf-8 string
@@ -41,6 +66,171 @@ def read_file_contents(path):
     return response.read().decode("utf-8")
 
 
+@st.cache_resource
+def get_results_cache():
+    """
+    Results cache shared by all sessions of the app.
+
+    Returns:
+    --------
+    ResultsCache
+    """
+    return ResultsCache()
+
+
+@st.cache_resource
+def get_job_queue():
+    """
+    Background simulation jobs shared by all sessions of the app.  Identical
+    requests from different sessions share a single job.
+
+    Returns:
+    --------
+    JobQueue
+    """
+    return JobQueue(get_results_cache())
+
+
+@st.cache_resource
+def get_metamodel():
+    """
+    Metamodel of the simulation shared by all sessions of the app.  It is
+    fitted to the results in the results cache.
+
+    Returns:
+    --------
+    Metamodel
+    """
+    return Metamodel()
+
+
+def show_prediction(params, placeholder):
+    """
+    Display the metamodel's predicted KPIs for the inputs.  Nothing is
+    shown until enough scenarios have been simulated.
+
+    Params:
+    -------
+    params: dict
+        n_operators, n_nurses and chance_callback
+
+    placeholder: streamlit placeholder
+        Container to display the predictions
+    """
+    metamodel = get_metamodel()
+    metamodel.update_from_cache(get_results_cache(), RESULTS_COLLECTION_PERIOD)
+    prediction = metamodel.predict(params)
+    if prediction is None:
+        return
+    with placeholder.container():
+        st.caption(
+            f"Predicted by a metamodel of {len(metamodel)} simulated scenarios. "
+            + "Run the simulation for exact results."
+        )
+        st.dataframe(prediction)
+
+
+@st.cache_resource
+def get_lookup_table():
+    """
+    Precomputed results shared by all sessions of the app.
+
+    Returns:
+    --------
+    LookupTable or None (if the table has not been built)
+    """
+    if not os.path.exists(os.path.join(LOOKUP_TABLE_PATH, "metadata.json")):
+        return None
+    return LookupTable(LOOKUP_TABLE_PATH)
+
+
+def select_backend(engine, params, n_reps):
+    """
+    The backend used to run the inputs.  'auto' runs a timed pilot of each
+    engine, so the pilot is skipped if the results are already cached.
+
+    Params:
+    -------
+    engine: str
+        The simulation engine selected by the user
+
+    params: dict
+        n_operators, n_nurses and chance_callback
+
+    n_reps: int
+        Number of replications
+
+    Returns:
+    --------
+    Backend
+    """
+    if engine == AUTO:
+        backend = get_backend(CACHE_BACKEND)
+        key = experiment_key(
+            backend.create_experiment(**params), RESULTS_COLLECTION_PERIOD
+        )
+        cached = get_results_cache().get(key)
+        if cached is not None and len(cached) >= n_reps:
+            return backend
+    return resolve_backend(engine, params, RESULTS_COLLECTION_PERIOD)
+
+
+def lookup_results(engine, params, n_reps, table, chart):
+    """
+    Display precomputed results for the inputs if they are in the lookup
+    table and the engine runs the same model as the table.
+
+    Params:
+    -------
+    engine: str
+        The simulation engine selected by the user
+
+    params: dict
+        n_operators, n_nurses and chance_callback
+
+    n_reps: int
+        Number of replications
+
+    table: streamlit placeholder
+        Container to display the tabular results
+
+    chart: streamlit placeholder
+        Container to display the histogram
+
+    Returns:
+    --------
+    bool
+        True if the results were found.
+    """
+    lookup = get_lookup_table()
+    if (
+        lookup is None
+        or engine not in LOOKUP_ENGINES
+        or lookup.rc_period != RESULTS_COLLECTION_PERIOD
+    ):
+        return False
+
+    caption = (
+        f"Precomputed results ({lookup.metadata['engine']} engine, "
+        + f"random number set {lookup.metadata['random_number_set']})."
+    )
+    results = lookup.results(n_reps=n_reps, **params)
+    if results is not None:
+        st.caption(caption)
+        show_results(results, table, chart)
+        return True
+
+    # summary only tables can be used if the replications match
+    if n_reps == lookup.n_reps:
+        summary = lookup.describe(**params)
+        if summary is not None:
+            st.caption(caption)
+            table.dataframe(summary)
+            chart.info("Histogram not available for precomputed results.")
+            return True
+    return False
+
+
 def create_user_filtered_hist(results):
     """
     Create a plotly histogram that includes a drop down list that allows a user
@@ -119,6 +309,90 @@ def create_user_filtered_hist(results):
     return fig
 
 
+def show_results(results, table, chart):
+    """
+    Display summary statistics and a histogram of replication results.
+
+    Params:
+    -------
+    results: pd.Dataframe
+        rows = replications, cols = KPIs
+
+    table: streamlit placeholder
+        Container to display the tabular results
+
+    chart: streamlit placeholder
+        Container to display the histogram
+    """
+    table.dataframe(results.describe())
+    chart.plotly_chart(create_user_filtered_hist(results), width="stretch")
+
+
+def create_results_area():
+    """
+    Create side by side containers for the tabular results and histogram.
+
+    Returns:
+    --------
+    tuple (streamlit placeholder, streamlit placeholder)
+        table and chart
+    """
+    col1, col2 = st.columns(2)
+    table = col1.expander("Tabular results", expanded=True).empty()
+    chart = col2.expander("Histogram", expanded=True).empty()
+    return table, chart
+
+
+def show_job(job, show_progress, polling):
+    """
+    Display the progress of a simulation job and its results.  Run as a
+    fragment that refreshes every UPDATE_INTERVAL seconds while the job
+    runs, so only this part of the app reruns.
+
+    Params:
+    -------
+    job: Job
+        The job running the replications
+
+    show_progress: bool
+        Display the results of the replications complete so far
+
+    polling: bool
+        The fragment refreshes until the job finishes.  The app is then
+        rerun once to stop the refresh.
+    """
+    if polling and job.finished:
+        st.rerun()
+
+    if job.status == FAILED:
+        st.error(f"Simulation failed: {job.error}")
+        return
+
+    table, chart = create_results_area()
+    results = job.results()
+    if job.status == DONE:
+        show_results(results, table, chart)
+        st.success("Done!")
+        return
+
+    if job.status == CANCELLED:
+        if results is not None:
+            show_results(results, table, chart)
+        st.warning(
+            f"Simulation cancelled after {job.n_complete} of {job.n_reps} "
+            "replications. Run the simulation again to complete it."
+        )
+        return
+
+    st.progress(
+        job.progress, text=f"{job.n_complete} of {job.n_reps} replications"
+    )
+    if show_progress and results is not None:
+        show_results(results, table, chart)
+    elif not show_progress:
+        table.info("Simulating the urgent care system...")
+
+
 ##################################################################################
 
 
@@ -154,29 +428,74 @@ with st.sidebar:
     # set number of replications
     n_reps = st.number_input("No. of replications", 100, 1_000, step=1)
 
-# create experiment
-exp = Experiment(
+    # simulation engine ('auto' picks the fastest for the inputs)
+    engine = st.selectbox(
+        "Simulation engine",
+        [AUTO] + available_backends(),
+        help="auto runs a short pilot of each engine and uses the fastest.",
+    )
+
+    # update the results as the replications run
+    show_progress = st.checkbox(
+        "Show results as they run",
+        help="Results update as replications complete. "
+        + "Changing an input cancels the run.",
+    )
+
+    # serve results from the lookup table when the inputs are in it
+    use_lookup = get_lookup_table() is not None and st.checkbox(
+        "Use precomputed results",
+        value=True,
+        help="Inputs in the precomputed grid are shown instantly unless the "
+        + "ciw engine is selected. The grid uses a fixed random number set. "
+        + "Other inputs are simulated.",
+    )
+
+# the engine is only resolved when the inputs are simulated
+params = dict(
     n_operators=n_operators, n_nurses=n_nurses, chance_callback=chance_callback
 )
+inputs = dict(params, engine=engine, n_reps=n_reps)
 
-# A user must press a streamlit button to run the model
-if st.button("Run simulation"):
-    #  add a spinner and then display success box
-    with st.spinner("Simulating the urgent care system..."):
-        # run multiple replications of experment
-        results = multiple_replications(exp, n_reps=n_reps)
+# a change of inputs cancels this session's request for a running job
+job = st.session_state.get("job")
+if job is not None and st.session_state.get("job_inputs") != inputs:
+    job.cancel()
+    job = st.session_state["job"] = None
 
-    st.success("Done!")
-
-    col1, col2 = st.columns(2)
-    with col1.expander("Tabular results", expanded=True):
-        # show tabular results
-        st.dataframe(results.describe())
+# instant approximate results (replaced by the simulation results)
+prediction = st.empty()
+if job is None:
+    show_prediction(params, prediction)
 
-    with col2.expander("Histogram", expanded=True):
-        # #########################################################################
-        # MODIFICATION: call updated plotly function
-        fig = create_user_filtered_hist(results)
-        ###########################################################################
+# A user must press a streamlit button to run the model
+if st.button("Run simulation"):
+    prediction.empty()
+
+    # precomputed results are shown immediately
+    precomputed = st.empty()
+    with precomputed.container():
+        table, chart = create_results_area()
+        found = use_lookup and lookup_results(engine, params, n_reps, table, chart)
+
+    if found:
+        if job is not None:
+            job.cancel()
+        job = st.session_state["job"] = None
+        st.success("Done!")
+    else:
+        precomputed.empty()
+        if job is None or job.finished:
+            # run replications in the background (or reuse cached results)
+            backend = select_backend(engine, params, n_reps)
+            exp = backend.create_experiment(**params)
+            job = st.session_state["job"] = get_job_queue().submit(
+                backend, exp, RESULTS_COLLECTION_PERIOD, n_reps, n_jobs=N_JOBS
+            )
+            st.session_state["job_inputs"] = inputs
 
-        st.plotly_chart(fig, width='stretch')
+# check on the job without blocking the rest of the app
+if job is not None:
+    polling = not job.finished
+    run_every = UPDATE_INTERVAL if polling else None
+    st.fragment(show_job, run_every=run_every)(job, show_progress, polling)
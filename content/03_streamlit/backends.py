@@ -0,0 +1,238 @@
+'''
+Registry of simulation backends for the 111 call centre model.
+
+Each backend wraps a model implementation (simpy, the vectorised fast
+engine or ciw) behind a common interface so that an app can select an
+engine by name.  The 'auto' option runs a short pilot of each available
+backend and routes the full run to the fastest.
+
+All backends accept the parameter names used by `model.Experiment`.
+'''
+import json
+import threading
+import time
+
+import model
+
+try:
+    import ciw_model
+except ImportError:
+    # ciw is an optional dependency
+    ciw_model = None
+
+# name used to select the fastest backend
+AUTO = 'auto'
+
+# proportion of the run length used by a pilot run in auto mode
+PILOT_FRACTION = 0.1
+
+
+class Backend():
+    '''
+    A simulation backend.  Packages up a function to create experiments 
+    and functions to run replications with a common signature.
+    '''
+    def __init__(self, name, create_experiment, iter_replications,
+                 multiple_replications):
+        '''
+        Constructor
+
+        Params:
+        ------
+        name: str
+            Unique name of the backend
+
+        create_experiment: callable
+            Called with `model.Experiment` parameter names to create an
+            experiment for the backend.
+
+        iter_replications: callable
+            Called as iter_replications(experiment, rc_period, n_reps,
+            n_jobs=, executor=, start_rep=, warm_up=).
+
+        multiple_replications: callable
+            Called as multiple_replications(experiment, rc_period, n_reps,
+            n_jobs=, executor=, start_rep=, warm_up=).
+        '''
+        self.name = name
+        self.create_experiment = create_experiment
+        self.iter_replications = iter_replications
+        self.multiple_replications = multiple_replications
+
+    def __repr__(self):
+        return f'Backend({self.name!r})'
+
+
+_registry = {}
+_selected = {}
+_lock = threading.Lock()
+
+
+def register_backend(backend):
+    '''
+    Add a backend to the registry.
+
+    Params:
+    ------
+    backend: Backend
+        The backend to register.  Replaces a backend with the same name.
+    '''
+    _registry[backend.name] = backend
+
+
+def available_backends():
+    '''
+    Names of the registered backends.
+
+    Returns:
+    -------
+    list
+    '''
+    return list(_registry)
+
+
+def get_backend(name):
+    '''
+    Return a registered backend by name.
+
+    Params:
+    ------
+    name: str
+        Name of the backend e.g. 'simpy'
+
+    Returns:
+    -------
+    Backend
+    '''
+    if name not in _registry:
+        raise ValueError(f'Unknown backend {name}. '
+                         + f'Available backends: {available_backends()}')
+    return _registry[name]
+
+
+def select_backend(params, rc_period=model.RESULTS_COLLECTION_PERIOD,
+                   names=None, pilot_fraction=PILOT_FRACTION):
+    '''
+    Select the fastest backend for an experiment.  Each backend runs a 
+    single pilot replication of `pilot_fraction` * `rc_period` and the 
+    fastest is returned.  The choice is remembered for the parameters.
+
+    Params:
+    ------
+    params: dict
+        Experiment parameters (`model.Experiment` names)
+
+    rc_period: float, optional (default=RESULTS_COLLECTION_PERIOD)
+        Run length of the full run.
+
+    names: list, optional (default=None)
+        Backends to compare.  None compares all available backends.
+
+    pilot_fraction: float, optional (default=PILOT_FRACTION)
+        Length of the pilot as a proportion of the run length.
+
+    Returns:
+    -------
+    Backend
+    '''
+    names = available_backends() if names is None else names
+    key = json.dumps([params, rc_period, names], sort_keys=True, default=str)
+    with _lock:
+        if key in _selected:
+            return get_backend(_selected[key])
+
+    timings = {}
+    for name in names:
+        backend = get_backend(name)
+        experiment = backend.create_experiment(**params)
+        start = time.perf_counter()
+        backend.multiple_replications(experiment, 
+                                      rc_period * pilot_fraction, 1)
+        timings[name] = time.perf_counter() - start
+
+    fastest = min(timings, key=timings.get)
+    with _lock:
+        _selected[key] = fastest
+    return get_backend(fastest)
+
+
+def resolve_backend(name, params, rc_period=model.RESULTS_COLLECTION_PERIOD):
+    '''
+    Return the backend called `name` or, if name is 'auto', the fastest
+    backend for the parameters.
+
+    Params:
+    ------
+    name: str
+        Backend name or 'auto'
+
+    params: dict
+        Experiment parameters (`model.Experiment` names)
+
+    rc_period: float, optional (default=RESULTS_COLLECTION_PERIOD)
+        Run length of the full run.
+
+    Returns:
+    -------
+    Backend
+    '''
+    if name == AUTO:
+        return select_backend(params, rc_period)
+    return get_backend(name)
+
+
+# Built in backends ###########################################################
+
+def _simpy_backend(name, engine):
+    '''
+    Create a backend for `model.py` using one of its engines.
+    '''
+    def iter_replications(experiment, rc_period, n_reps, n_jobs=1, 
+                          executor=None, start_rep=0, 
+                          warm_up=model.WARM_UP):
+        return model.iter_replications(experiment, rc_period, n_reps,
+                                       n_jobs, executor, engine, start_rep,
+                                       warm_up)
+
+    def multiple_replications(experiment, rc_period, n_reps, n_jobs=1, 
+                              executor=None, start_rep=0, 
+                              warm_up=model.WARM_UP):
+        return model.multiple_replications(experiment, rc_period, n_reps,
+                                           n_jobs, executor, engine, 
+                                           start_rep, warm_up)
+
+    return Backend(name, model.ExperimentSpec, iter_replications, 
+                   multiple_replications)
+
+
+def _create_ciw_experiment(mean_iat=model.MEAN_IAT, random_number_set=None,
+                           **params):
+    '''
+    Create a `ciw_model.Experiment` from `model.Experiment` parameters.
+    ciw's exponential distribution is parameterised by its rate.
+    '''
+    return ciw_model.Experiment(mean_iat=1.0 / mean_iat, 
+                                random_seed=random_number_set, **params)
+
+
+def _ciw_iter_replications(experiment, rc_period, n_reps, n_jobs=1, 
+                           executor=None, start_rep=0, 
+                           warm_up=model.WARM_UP):
+    return ciw_model.iter_replications(experiment, rc_period, n_reps, n_jobs,
+                                       executor, start_rep, warm_up)
+
+
+def _ciw_multiple_replications(experiment, rc_period, n_reps, n_jobs=1, 
+                               executor=None, start_rep=0, 
+                               warm_up=model.WARM_UP):
+    return ciw_model.multiple_replications(experiment, rc_period, n_reps,
+                                           n_jobs, executor, start_rep, 
+                                           warm_up)
+
+
+register_backend(_simpy_backend('simpy', 'simpy'))
+register_backend(_simpy_backend('fast', 'fast'))
+if ciw_model is not None:
+    register_backend(Backend('ciw', _create_ciw_experiment, 
+                             _ciw_iter_replications, 
+                             _ciw_multiple_replications))
@@ -0,0 +1,325 @@
+'''
+Benchmark suite for the 111 call centre simulation engines.
+
+Measures how `model.single_run`, `model.multiple_replications` and
+`ciw_model.single_run` scale with arrival rate, run length, resource counts,
+number of replications and number of worker processes.  For each case the
+suite records wall time per replication, events per second and peak memory.
+Results are saved to JSON so that versions can be compared to catch
+performance regressions.
+
+Events are the expected number of operator and nurse services in a run,
+calculated from the parameters, so every engine is credited with the same
+work and events per second can be compared across engines.  Peak memory is
+traced in the main process only.  Cases that use worker processes also
+report the peak resident memory of the largest worker (Unix only).
+
+Usage:
+
+    python benchmark.py --output results.json
+    python benchmark.py --quick --compare results.json
+
+All runs use fixed seeds and no network access.
+'''
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+try:
+    import resource
+except ImportError:
+    # resource is only available on Unix
+    resource = None
+
+import numpy as np
+import pandas as pd
+import simpy
+
+import model
+
+try:
+    import ciw
+    import ciw_model
+except ImportError:
+    # ciw is an optional dependency
+    ciw_model = None
+
+# seed used for all benchmark experiments
+RANDOM_NUMBER_SET = 42
+
+# number of times each case is timed (the median is reported)
+REPEATS = 3
+
+# default slowdown (proportion) reported as a regression by --compare
+THRESHOLD = 0.2
+
+
+def expected_events(params, rc_period):
+    '''
+    Expected number of operator and nurse services in a replication.  The
+    same for every engine.
+
+    Params:
+    ------
+    params: dict
+        `model.Experiment` parameters
+
+    rc_period: float
+        Run length
+
+    Returns:
+    -------
+    float
+    '''
+    mean_iat = params.get('mean_iat', model.MEAN_IAT)
+    chance_callback = params.get('chance_callback', model.CHANCE_CALLBACK)
+    return rc_period / mean_iat * (1.0 + chance_callback)
+
+
+def simpy_single_run(params, rc_period, engine):
+    '''
+    Benchmark task: a single replication of `model.py`.
+    '''
+    experiment = model.Experiment(random_number_set=RANDOM_NUMBER_SET,
+                                  **params)
+    model.single_run(experiment, rc_period, rep=0, engine=engine)
+
+
+def ciw_single_run(params, rc_period, engine=None):
+    '''
+    Benchmark task: a single replication of `ciw_model.py`, including the
+    processing of ciw's records into KPIs.
+    '''
+    params = dict(params)
+    params['mean_iat'] = 1.0 / params.get('mean_iat', model.MEAN_IAT)
+    experiment = ciw_model.Experiment(random_seed=RANDOM_NUMBER_SET,
+                                      **params)
+    ciw_model.single_run(experiment, rc_period,
+                         experiment.replication_seed(0))
+
+
+def replications(params, rc_period, engine, n_reps, n_jobs):
+    '''
+    Benchmark task: `model.multiple_replications`.
+    '''
+    experiment = model.Experiment(random_number_set=RANDOM_NUMBER_SET,
+                                  **params)
+    model.multiple_replications(experiment, rc_period, n_reps, n_jobs=n_jobs,
+                                engine=engine)
+
+
+def benchmark_cases(quick=False):
+    '''
+    The benchmark cases.  Each case is a dict with a name, a task
+    function, its keyword arguments and the number of replications the
+    task runs.
+
+    Params:
+    ------
+    quick: bool, optional (default=False)
+        Use a smaller set of cases with shorter run lengths.
+
+    Returns:
+    -------
+    list
+    '''
+    rc_period = 200 if quick else model.RESULTS_COLLECTION_PERIOD
+    mean_iats = [1.2, 0.6] if quick else [2.4, 1.2, 0.6, 0.3]
+    run_lengths = [200, 400] if quick else [500, 1000, 2000, 4000]
+    staffing = [(13, 9), (20, 15)] if quick else [(10, 6), (13, 9), (20, 15)]
+    n_reps = [2, 4] if quick else [5, 10, 20]
+    n_jobs = [1, 2] if quick else sorted({1, 2, 4, os.cpu_count() or 1})
+
+    engines = {'simpy': simpy_single_run, 'fast': simpy_single_run}
+    if ciw_model is not None:
+        engines['ciw'] = ciw_single_run
+
+    cases = []
+    for engine, task in engines.items():
+        for mean_iat in mean_iats:
+            cases.append({'name': f'{engine}/arrival_rate/mean_iat={mean_iat}',
+                          'task': task, 'n_reps': 1,
+                          'kwargs': {'params': {'mean_iat': mean_iat},
+                                     'rc_period': rc_period,
+                                     'engine': engine}})
+        for run_length in run_lengths:
+            cases.append({'name': f'{engine}/run_length/{run_length}',
+                          'task': task, 'n_reps': 1,
+                          'kwargs': {'params': {}, 'rc_period': run_length,
+                                     'engine': engine}})
+        for n_operators, n_nurses in staffing:
+            cases.append({'name': f'{engine}/resources/'
+                                  + f'{n_operators}x{n_nurses}',
+                          'task': task, 'n_reps': 1,
+                          'kwargs': {'params': {'n_operators': n_operators,
+                                                'n_nurses': n_nurses},
+                                     'rc_period': rc_period,
+                                     'engine': engine}})
+
+    for reps in n_reps:
+        cases.append({'name': f'simpy/replications/{reps}',
+                      'task': replications, 'n_reps': reps,
+                      'kwargs': {'params': {}, 'rc_period': rc_period,
+                                 'engine': 'simpy', 'n_reps': reps,
+                                 'n_jobs': 1}})
+    for jobs in n_jobs:
+        reps = max(n_reps)
+        cases.append({'name': f'simpy/workers/{jobs}',
+                      'task': replications, 'n_reps': reps,
+                      'kwargs': {'params': {}, 'rc_period': rc_period,
+                                 'engine': 'simpy', 'n_reps': reps,
+                                 'n_jobs': jobs}})
+    return cases
+
+
+def run_case(case, repeats=REPEATS):
+    '''
+    Time a benchmark case and measure its peak memory.
+
+    Params:
+    ------
+    case: dict
+        A case from `benchmark_cases()`
+
+    repeats: int, optional (default=REPEATS)
+        Number of timed runs.  The median is reported.
+
+    Returns:
+    -------
+    dict
+    '''
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        case['task'](**case['kwargs'])
+        timings.append(time.perf_counter() - start)
+    wall_time = float(np.median(timings))
+
+    # peak memory is measured in a separate run as tracing adds overhead.
+    # tracemalloc only sees allocations in this process.
+    tracemalloc.start()
+    case['task'](**case['kwargs'])
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    n_events = expected_events(case['kwargs']['params'],
+                               case['kwargs']['rc_period']) * case['n_reps']
+    result = {'name': case['name'],
+              'wall_time': wall_time,
+              'time_per_replication': wall_time / case['n_reps'],
+              'peak_memory_mb': peak / 1024 ** 2,
+              'peak_worker_memory_mb': None,
+              'events': n_events,
+              'events_per_second': n_events / wall_time}
+
+    # largest resident memory of any worker process waited for so far
+    # (ru_maxrss is in KB on Linux)
+    if case['kwargs'].get('n_jobs', 1) != 1 and resource is not None:
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        result['peak_worker_memory_mb'] = usage.ru_maxrss / 1024
+    return result
+
+
+def environment_info():
+    '''
+    Versions and hardware used to run the benchmarks.
+
+    Returns:
+    -------
+    dict
+    '''
+    info = {'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'simpy': simpy.__version__}
+    if ciw_model is not None:
+        info['ciw'] = ciw.__version__
+    return info
+
+
+def compare(results, baseline, threshold=THRESHOLD):
+    '''
+    Compare wall times against a baseline run.
+
+    Params:
+    ------
+    results: dict
+        Benchmark results
+
+    baseline: dict
+        Benchmark results of a previous version
+
+    threshold: float, optional (default=THRESHOLD)
+        Proportional slowdown reported as a regression.
+
+    Returns:
+    -------
+    pandas.DataFrame
+        Wall time of each case in both runs and the ratio.
+    '''
+    current = pd.DataFrame(results['cases']).set_index('name')['wall_time']
+    previous = pd.DataFrame(baseline['cases']).set_index('name')['wall_time']
+    comparison = pd.concat([previous, current], axis=1, join='inner',
+                           keys=['baseline', 'current'])
+    comparison['ratio'] = comparison['current'] / comparison['baseline']
+    comparison['regression'] = comparison['ratio'] > 1 + threshold
+    return comparison
+
+
+def main(argv=None):
+    '''
+    Run the benchmark suite from the command line.
+    '''
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--output', default='benchmark_results.json',
+                        help='JSON file to save results to')
+    parser.add_argument('--quick', action='store_true',
+                        help='run a smaller set of shorter cases')
+    parser.add_argument('--repeats', type=int, default=REPEATS,
+                        help='number of timed runs of each case')
+    parser.add_argument('--filter', default='',
+                        help='only run cases whose name contains this text')
+    parser.add_argument('--compare', default=None,
+                        help='baseline JSON results to compare against')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                        help='slowdown reported as a regression')
+    args = parser.parse_args(argv)
+
+    cases = [case for case in benchmark_cases(args.quick)
+             if args.filter in case['name']]
+
+    results = {'environment': environment_info(), 'quick': args.quick,
+               'cases': []}
+    for case in cases:
+        print(f"{case['name']}", end=' => ', flush=True)
+        result = run_case(case, args.repeats)
+        results['cases'].append(result)
+        print(f"{result['time_per_replication']:.4f}s per replication")
+    print('Peak memory is for the main process only. '
+          + 'peak_worker_memory_mb is the largest worker process.')
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'Results saved to {args.output}')
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        comparison = compare(results, baseline, args.threshold)
+        print(comparison.round(3).to_string())
+        if comparison['regression'].any():
+            print('Performance regressions found.')
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,12 +5,20 @@ ciw backend in place of simpy
 import streamlit as st
 import plotly.graph_objects as go
 
-# MODIFICATION: import from ciw_model.py ########################################
-from ciw_model import Experiment, multiple_replications
+# MODIFICATION: use the ciw backend #############################################
+from backends import get_backend
+from ciw_model import RESULTS_COLLECTION_PERIOD
 #################################################################################
+from results_cache import ResultsCache
 
 INTRO_FILE = './resources/model_info.md'
 
+# number of worker processes used to run replications (-1 = all cores)
+N_JOBS = -1
+
+# simulation backend
+ENGINE = 'ciw'
+
 def read_file_contents(file_name):
     ''''
     Read the contents of a file.
@@ -27,6 +35,17 @@ def read_file_contents(file_name):
     with open(file_name) as f:
         return f.read()
     
+@st.cache_resource
+def get_results_cache():
+    '''
+    Results cache shared by all sessions of the app.
+
+    Returns:
+    --------
+    ResultsCache
+    '''
+    return ResultsCache()
+
 def create_user_filtered_hist(results):
     '''
     Create a plotly histogram that includes a drop down list that allows a user
@@ -127,16 +146,21 @@ with st.sidebar:
     n_reps = st.number_input("No. of replications", 100, 1_000, step=1)
 
 # create experiment
-exp = Experiment(n_operators=n_operators, n_nurses=n_nurses,
-                 chance_callback=chance_callback)
+backend = get_backend(ENGINE)
+exp = backend.create_experiment(n_operators=n_operators, n_nurses=n_nurses,
+                                chance_callback=chance_callback)
 
 # A user must press a streamlit button to run the model
 if st.button("Run simulation"):
 
     #  add a spinner and then display success box
     with st.spinner('Simulating the urgent care system...'):
-        # run multiple replications of experment
-        results = multiple_replications(exp, n_reps=n_reps)
+        # run multiple replications of experment (or reuse cached results)
+        results = get_results_cache().get_or_run(exp, 
+                                                 RESULTS_COLLECTION_PERIOD,
+                                                 n_reps, 
+                                                 backend.multiple_replications,
+                                                 n_jobs=N_JOBS)
     
     st.success('Done!')
 
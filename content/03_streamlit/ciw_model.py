@@ -8,6 +8,9 @@ Time units of the simulation model are in minutes.
 import numpy as np
 import pandas as pd
 import ciw
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from model import create_executor
 
 # Module level variables, constants, and default values
 
@@ -33,6 +36,22 @@ CHANCE_CALLBACK = 0.4
 
 # run variables
 RESULTS_COLLECTION_PERIOD = 1000
+WARM_UP = 0.0
+
+# default number of parallel worker processes (1 = run in serial)
+N_JOBS = 1
+
+# ciw record fields converted to columnar arrays for results processing
+RECORD_DTYPE = np.dtype([('node', np.int64),
+                         ('waiting_time', np.float64),
+                         ('service_time', np.float64),
+                         ('arrival_date', np.float64),
+                         ('service_start_date', np.float64),
+                         ('exit_date', np.float64)])
+
+# node numbers of the operators and nurses in the ciw network
+OPERATOR_NODE = 1
+NURSE_NODE = 2
 
 
 # Experiment class
@@ -49,11 +68,25 @@ class Experiment:
                  random_seed=None):
         '''
         The init method sets up our defaults. 
+
+        `random_seed` is the root seed of the seed schedule used by each 
+        replication.  If set to None then a unique schedule is created for
+        this experiment.
         '''
         self.n_operators = n_operators
         
         # store the number of nurses in the experiment
         self.n_nurses = n_nurses
+
+        # store the distribution parameters and seed
+        self.mean_iat = mean_iat
+        self.call_low = call_low
+        self.call_mode = call_mode
+        self.call_high = call_high
+        self.nurse_call_low = nurse_call_low
+        self.nurse_call_high = nurse_call_high
+        self.random_seed = random_seed
+        self.seed_sequence = np.random.SeedSequence(random_seed)
         
         # arrival distribution
         self.arrival_dist = ciw.dists.Exponential(mean_iat)
@@ -89,6 +122,47 @@ class Experiment:
         self.results['nurse_waiting_times'] = []
         self.results['total_nurse_call_duration'] = 0.0
 
+    def replication_seed(self, rep):
+        '''
+        The seed for `ciw.seed` used by replication `rep`.  Each 
+        replication's seed is taken from an independent child of the 
+        experiment's SeedSequence so that replications can be run in any
+        order or in parallel.
+
+        Params:
+        ------
+        rep: int
+            The replication number (zero indexed).
+
+        Returns:
+        -------
+        int
+        '''
+        rep_sequence = np.random.SeedSequence(
+            self.seed_sequence.entropy,
+            spawn_key=self.seed_sequence.spawn_key + (rep,))
+        return int(rep_sequence.generate_state(1)[0])
+
+    def parameters(self):
+        '''
+        The input parameters of the experiment.  Used to identify an 
+        experiment e.g. when caching results.
+
+        Returns:
+        -------
+        dict
+        '''
+        return {'n_operators': self.n_operators,
+                'n_nurses': self.n_nurses,
+                'mean_iat': self.mean_iat,
+                'call_low': self.call_low,
+                'call_mode': self.call_mode,
+                'call_high': self.call_high,
+                'chance_callback': self.chance_callback,
+                'nurse_call_low': self.nurse_call_low,
+                'nurse_call_high': self.nurse_call_high,
+                'random_seed': self.random_seed}
+
 
 # Model code
 
@@ -116,11 +190,64 @@ def get_model(args):
     return model
 
 
+# Results processing
+
+def records_to_array(recs):
+    '''
+    Convert ciw records into a columnar numpy structured array in a single
+    pass.
+    
+    Params:
+    ------
+    recs: list
+        records returned by `ciw.Simulation.get_all_records()`
+
+    Returns:
+    --------
+    numpy.ndarray
+        Structured array with fields in RECORD_DTYPE
+    '''
+    return np.fromiter(((r.node, r.waiting_time, r.service_time, 
+                         r.arrival_date, r.service_start_date, r.exit_date)
+                        for r in recs), 
+                       dtype=RECORD_DTYPE, count=len(recs))
+
+def group_by_node(records, field, mask=None):
+    '''
+    Total and count of a record field by node.
+    
+    Params:
+    ------
+    records: numpy.ndarray
+        Structured array returned by `records_to_array`
+
+    field: str
+        The field to total e.g. 'waiting_time'
+
+    mask: numpy.ndarray, optional (default=None)
+        Boolean array.  Only records where mask is True are included.
+
+    Returns:
+    --------
+    tuple (numpy.ndarray, numpy.ndarray)
+        Totals and counts indexed by node number.
+    '''
+    nodes = records['node']
+    values = records[field]
+    if mask is not None:
+        nodes = nodes[mask]
+        values = values[mask]
+    n_nodes = NURSE_NODE + 1
+    totals = np.bincount(nodes, weights=values, minlength=n_nodes)
+    counts = np.bincount(nodes, minlength=n_nodes)
+    return totals, counts
+
 # Model wrapper functions
 
 def single_run(experiment, 
                rc_period=RESULTS_COLLECTION_PERIOD, 
-               random_seed=None):
+               random_seed=None,
+               warm_up=WARM_UP):
     '''
     Conduct a single run of the simulation model.
     
@@ -131,6 +258,12 @@ def single_run(experiment,
         
     random_seed: int
         Random seed to control simulation run.
+
+    warm_up: float, optional (default=WARM_UP)
+        Length of the warm-up period.  The model runs for warm_up + 
+        rc_period. Waiting times are only collected for services that 
+        start after the warm-up and utilisation for services that end 
+        after the warm-up.
     '''
     
     # results dictionary.  Each KPI is a new entry.
@@ -146,44 +279,133 @@ def single_run(experiment,
     sim_engine = ciw.Simulation(model)
     
     # run the model
-    sim_engine.simulate_until_max_time(rc_period)
+    sim_engine.simulate_until_max_time(warm_up + rc_period)
     
     # return processed results for run.
     
-    # get all results
-    recs = sim_engine.get_all_records()
-    
-    # operator service times
-    op_servicetimes = [r.service_time for r in recs if r.node==1]
-    # nurse service times
-    nurse_servicetimes = [r.service_time for r in recs if r.node==2]
+    # get all results as columnar arrays
+    records = records_to_array(sim_engine.get_all_records())
+
+    # service times of services completed after the warm-up
+    service_totals, _ = group_by_node(records, 'service_time',
+                                      records['exit_date'] >= warm_up)
     
-    # operator and nurse waiting times
-    op_waits = [r.waiting_time for r in recs if r.node==1]
-    nurse_waits = [r.waiting_time for r in recs if r.node==2]
+    # waiting times of services started after the warm-up
+    wait_totals, wait_counts = \
+        group_by_node(records, 'waiting_time', 
+                      records['service_start_date'] >= warm_up)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_waits = wait_totals / wait_counts
     
     # mean measures
-    run_results['01_mean_waiting_time'] = np.mean(op_waits)
+    run_results['01_mean_waiting_time'] = mean_waits[OPERATOR_NODE]
         
     # end of run results: calculate mean operator utilisation
     run_results['02_operator_util'] = \
-        (sum(op_servicetimes) / (rc_period * experiment.n_operators)) * 100.0
+        (service_totals[OPERATOR_NODE] 
+         / (rc_period * experiment.n_operators)) * 100.0
     
     # end of run results: nurse waiting time
-    run_results['03_mean_nurse_waiting_time'] = np.mean(nurse_waits)
+    run_results['03_mean_nurse_waiting_time'] = mean_waits[NURSE_NODE]
     
     # end of run results: calculate mean nurse utilisation
     run_results['04_nurse_util'] = \
-        (sum(nurse_servicetimes) / (rc_period * experiment.n_nurses)) * 100.0
+        (service_totals[NURSE_NODE] 
+         / (rc_period * experiment.n_nurses)) * 100.0
     
     # return the results from the run of the model
     return run_results
 
+def _replication_worker(experiment, rc_period, rep, warm_up):
+    '''
+    Run a single replication in a worker process using the replication's
+    seed.
+    '''
+    return single_run(experiment, rc_period, experiment.replication_seed(rep),
+                      warm_up)
+
+def iter_replications(experiment, rc_period=RESULTS_COLLECTION_PERIOD,
+                      n_reps=5, n_jobs=N_JOBS, executor=None, start_rep=0,
+                      warm_up=WARM_UP):
+    '''
+    Run multiple replications of the model and yield the results of each
+    replication as it completes.  When replications are run in parallel
+    they are yielded in completion order.
+
+    Closing the generator early cancels any replications that have not 
+    started.
+
+    Params:
+    ------
+    experiment: Experiment
+        The experiment/paramaters to use with model
+    
+    rc_period: float, optional (default=DEFAULT_RESULTS_COLLECTION_PERIOD)
+        results collection period.  
+        the number of minutes to run the model to collect results
+
+    n_reps: int, optional (default=5)
+        Number of independent replications to run.
+
+    n_jobs: int, optional (default=N_JOBS)
+        Number of worker processes to use.  1 runs the replications in
+        serial.  -1 uses all available cores.
+
+    executor: concurrent.futures.Executor, optional (default=None)
+        An existing process pool to run the replications.  If provided 
+        `n_jobs` is ignored.  ciw seeds the process wide `random` module
+        so thread pools are rejected: replications run in threads would
+        share a single generator.
+
+    start_rep: int, optional (default=0)
+        The (zero indexed) replication number of the first replication.
+
+    warm_up: float, optional (default=WARM_UP)
+        Length of the warm-up period of each replication.
+
+    Yields:
+    -------
+    tuple (int, dict)
+        The replication label (one indexed, as used in the results 
+        DataFrame) and the replication's KPIs.
+    '''
+    if isinstance(executor, ThreadPoolExecutor):
+        raise ValueError('ciw replications must run in a process pool. '
+                         + 'Threads share the global random generator.')
+
+    reps = range(start_rep, start_rep + n_reps)
+
+    if executor is None and n_jobs == 1:
+        for rep in reps:
+            yield rep + 1, _replication_worker(experiment, rc_period, rep,
+                                               warm_up)
+        return
+
+    own_executor = executor is None
+    if own_executor:
+        executor = create_executor(n_jobs)
+
+    futures = {executor.submit(_replication_worker, experiment, rc_period, 
+                               rep, warm_up): rep for rep in reps}
+    try:
+        for future in as_completed(futures):
+            yield futures[future] + 1, future.result()
+    finally:
+        for future in futures:
+            future.cancel()
+        if own_executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+
 def multiple_replications(experiment, 
                           rc_period=RESULTS_COLLECTION_PERIOD,
-                          n_reps=5):
+                          n_reps=5, n_jobs=N_JOBS, executor=None,
+                          start_rep=0, warm_up=WARM_UP):
     '''
     Perform multiple replications of the model.
+
+    Each replication is seeded from the experiment's seed schedule so 
+    results are reproducible (if `random_seed` is set) and identical 
+    regardless of the number of worker processes.
     
     Params:
     ------
@@ -196,18 +418,34 @@ def multiple_replications(experiment,
 
     n_reps: int, optional (default=5)
         Number of independent replications to run.
+
+    n_jobs: int, optional (default=N_JOBS)
+        Number of worker processes to use.  1 runs the replications in
+        serial.  -1 uses all available cores.
+
+    executor: concurrent.futures.Executor, optional (default=None)
+        An existing process pool to run the replications.  If provided 
+        `n_jobs` is ignored.  ciw seeds the process wide `random` module
+        so thread pools are rejected: replications run in threads would
+        share a single generator.
+
+    start_rep: int, optional (default=0)
+        The (zero indexed) replication number of the first replication.
+        Used to extend an existing set of replications.
+
+    warm_up: float, optional (default=WARM_UP)
+        Length of the warm-up period of each replication.
         
     Returns:
     --------
     pandas.DataFrame
     '''
-
-    # loop over single run to generate results dicts in a python list.
-    results = [single_run(experiment, rc_period) for rep in range(n_reps)]
+    results = dict(iter_replications(experiment, rc_period, n_reps, n_jobs,
+                                     executor, start_rep, warm_up))
         
     # format and return results in a dataframe
-    df_results = pd.DataFrame(results)
-    df_results.index = np.arange(1, len(df_results)+1)
-    df_results.index.name = 'rep'
+    reps = sorted(results)
+    df_results = pd.DataFrame([results[rep] for rep in reps], 
+                              index=pd.Index(reps, name='rep'))
     return df_results
 
@@ -0,0 +1,152 @@
+'''
+A compact, array backed log of events recorded during a run of a model.
+
+Rows are stored in a preallocated numpy structured array that doubles in
+size when it is full.  After a run the log can be viewed as a pandas 
+DataFrame without copying the data.
+'''
+import numpy as np
+import pandas as pd
+
+# default number of rows allocated when a log is created
+INITIAL_CAPACITY = 1024
+
+
+class EventLog():
+    '''
+    Array backed event log.  Each row is an entity (e.g. a caller) and each
+    column is a field of a numpy structured dtype.  Fields can be recorded
+    at different times during a run.
+    '''
+    def __init__(self, dtype, defaults=None, capacity=INITIAL_CAPACITY):
+        '''
+        Constructor
+
+        Params:
+        ------
+        dtype: numpy.dtype
+            Structured dtype of a row in the log.
+
+        defaults: dict, optional (default=None)
+            Value of a field before it is recorded.  Float fields default
+            to nan and other fields to zero.
+
+        capacity: int, optional (default=INITIAL_CAPACITY)
+            Number of rows initially allocated.
+        '''
+        self.dtype = np.dtype(dtype)
+        self.defaults = {name: np.nan if self.dtype[name].kind == 'f' else 0
+                         for name in self.dtype.names}
+        if defaults is not None:
+            self.defaults.update(defaults)
+        self.n = 0
+        self._data = self._allocate(capacity)
+
+    def __len__(self):
+        return self.n
+
+    def _allocate(self, capacity):
+        '''
+        Allocate an array of rows filled with the default values.
+        '''
+        data = np.empty(capacity, dtype=self.dtype)
+        for name, value in self.defaults.items():
+            data[name] = value
+        return data
+
+    def _reserve(self, n_rows):
+        '''
+        Make sure there is space for `n_rows` more rows.  Capacity is at 
+        least doubled when the log grows.
+        '''
+        required = self.n + n_rows
+        if required > len(self._data):
+            capacity = max(required, 2 * len(self._data))
+            data = self._allocate(capacity)
+            data[:self.n] = self._data[:self.n]
+            self._data = data
+
+    def append(self, **values):
+        '''
+        Add a new row to the log.  Fields not provided take their default.
+
+        Params:
+        ------
+        **values:
+            Field values for the row.
+
+        Returns:
+        -------
+        int
+            The index of the new row.
+        '''
+        self._reserve(1)
+        row = self.n
+        for name, value in values.items():
+            self._data[name][row] = value
+        self.n += 1
+        return row
+
+    def extend(self, n_rows, **columns):
+        '''
+        Add multiple rows to the log.
+
+        Params:
+        ------
+        n_rows: int
+            Number of rows to add.
+
+        **columns:
+            Array of values (length n_rows) for each field provided.
+
+        Returns:
+        -------
+        int
+            The index of the first new row.
+        '''
+        self._reserve(n_rows)
+        first_row = self.n
+        for name, values in columns.items():
+            self._data[name][first_row:first_row + n_rows] = values
+        self.n += n_rows
+        return first_row
+
+    def record(self, row, field, value):
+        '''
+        Record the value of a field for an existing row.
+
+        Params:
+        ------
+        row: int or array-like
+            Index of the row(s) returned by `append()` or `extend()`.
+
+        field: str
+            Name of the field
+
+        value: object
+            The value(s) to record.
+        '''
+        self._data[field][row] = value
+
+    def to_array(self):
+        '''
+        View of the rows in the log as a structured array (no copy).
+
+        Returns:
+        -------
+        numpy.ndarray
+        '''
+        return self._data[:self.n]
+
+    def to_frame(self):
+        '''
+        The log as a DataFrame.  Each column is a view of the log's 
+        data (no copy).
+
+        Returns:
+        -------
+        pandas.DataFrame
+        '''
+        data = self.to_array()
+        return pd.DataFrame({name: data[name] for name in self.dtype.names},
+                            copy=False)
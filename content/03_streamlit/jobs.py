@@ -0,0 +1,331 @@
+'''
+Background execution of simulation runs for the streamlit apps.
+
+A `JobQueue` runs the replications of an experiment in a background thread
+so that a streamlit script can submit a run, return immediately and poll
+the job's progress on later reruns.  Jobs are keyed on the experiment
+hash (see `results_cache.experiment_key`): requests for the same
+experiment made while a job is in progress (e.g. by different users)
+share the same job.  A request for more replications extends the job in
+progress, so the job runs the largest number requested.  Completed
+results are stored in a `ResultsCache`, so cached replications are reused
+and only the missing ones are run.
+
+A job is cancelled when every session that submitted it has cancelled
+(e.g. because its user changed an input).  Replications that completed
+before a cancellation are kept in the cache.
+
+The queue should be created once per app server e.g. using
+`st.cache_resource`.
+
+Jobs run in threads of the app process.  The ciw backend seeds the
+process wide `random` module, so ciw jobs should run their replications
+in worker processes (n_jobs != 1 or a process pool executor).
+'''
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from results_cache import WARM_UP, ResultsCache, experiment_description, \
+    experiment_key
+
+# default maximum number of jobs run at the same time
+MAX_JOBS = 2
+
+# job states
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+CANCELLED = 'cancelled'
+FAILED = 'failed'
+
+
+class Job():
+    '''
+    A run of the replications of an experiment.  Read its progress from
+    any thread.
+    '''
+    def __init__(self, key, n_reps):
+        '''
+        Constructor
+
+        Params:
+        ------
+        key: str
+            Key created by `experiment_key`
+
+        n_reps: int
+            Number of replications.  May be increased by later requests
+            while the job is in progress.
+        '''
+        self.key = key
+        self.n_reps = n_reps
+        self.status = QUEUED
+        self.error = None
+        self._rows = {}
+        self._subscribers = 1
+        self._cancel = threading.Event()
+        self._finished = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def n_complete(self):
+        '''
+        Number of replications complete
+        '''
+        return len(self._rows)
+
+    @property
+    def progress(self):
+        '''
+        Proportion of replications complete
+        '''
+        return self.n_complete / self.n_reps
+
+    @property
+    def finished(self):
+        '''
+        Is the job done, cancelled or failed?
+        '''
+        return self._finished.is_set()
+
+    def results(self):
+        '''
+        Results of the replications complete so far.
+
+        Returns:
+        -------
+        pandas.DataFrame or None (if no replications are complete)
+        '''
+        with self._lock:
+            if not self._rows:
+                return None
+            results = pd.DataFrame.from_dict(self._rows, orient='index')
+        results = results.sort_index()
+        results.index.name = 'rep'
+        return results
+
+    def wait(self, timeout=None):
+        '''
+        Block until the job finishes.
+
+        Returns:
+        -------
+        bool
+            True if the job finished before the timeout.
+        '''
+        return self._finished.wait(timeout)
+
+    def cancel(self):
+        '''
+        Withdraw one request for the job.  The job stops (after the
+        replications in progress) when all requests are withdrawn.
+        '''
+        with self._lock:
+            self._subscribers -= 1
+            if self._subscribers <= 0:
+                self._cancel.set()
+
+    def _subscribe(self, n_reps):
+        '''
+        Add a request for `n_reps` replications, extending the job if
+        needed.  Returns False if the job is already being cancelled.
+        '''
+        with self._lock:
+            if self._cancel.is_set():
+                return False
+            self._subscribers += 1
+            self.n_reps = max(self.n_reps, n_reps)
+            return True
+
+    def _add(self, rep, kpis):
+        with self._lock:
+            self._rows[rep] = kpis
+
+    def _finish(self, status, error=None):
+        self.status = status
+        self.error = error
+        self._finished.set()
+
+    def __repr__(self):
+        return f'Job({self.key[:8]}, {self.n_complete}/{self.n_reps}, ' \
+            + f'{self.status})'
+
+
+class JobQueue():
+    '''
+    Runs simulation jobs in background threads.  Thread safe.
+    '''
+    def __init__(self, cache=None, max_jobs=MAX_JOBS, executor=None):
+        '''
+        Constructor
+
+        Params:
+        ------
+        cache: ResultsCache, optional (default=None)
+            Cache of completed replications.  If None a new cache is
+            created.
+
+        max_jobs: int, optional (default=MAX_JOBS)
+            Maximum number of jobs run at the same time.  Others wait in
+            the queue.
+
+        executor: concurrent.futures.Executor, optional (default=None)
+            Passed to the backend to run replications e.g. a shared
+            process pool.  If None each job uses `n_jobs` processes.
+        '''
+        self.cache = ResultsCache() if cache is None else cache
+        self.executor = executor
+        self._threads = ThreadPoolExecutor(max_workers=max_jobs,
+                                           thread_name_prefix='sim-job')
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, backend, experiment, rc_period, n_reps, n_jobs=1,
+               warm_up=WARM_UP):
+        '''
+        Request the replications of an experiment.  Returns immediately.
+
+        Params:
+        ------
+        backend: backends.Backend
+            Runs the replications
+
+        experiment: Experiment or ExperimentSpec
+            The experiment to run (created by the backend).  Must not be
+            modified while the job runs.
+
+        rc_period: float
+            Model run length
+
+        n_reps: int
+            Number of replications
+
+        n_jobs: int, optional (default=1)
+            Number of processes used by the job if the queue has no
+            executor.
+
+        warm_up: float, optional (default=WARM_UP)
+            Length of the warm-up period of each replication.  Part of the
+            job key.
+
+        Returns:
+        -------
+        Job
+            A new job, the in-progress job for the same experiment
+            (extended to at least `n_reps` replications), or a finished
+            job if the results are already cached.
+        '''
+        key = experiment_key(experiment, rc_period, warm_up)
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and job._subscribe(n_reps):
+                return job
+
+            job = Job(key, n_reps)
+            cached = self.cache.get(key)
+            if cached is not None:
+                for rep, kpis in cached.iloc[:n_reps].to_dict(
+                        orient='index').items():
+                    job._add(rep, kpis)
+            if job.n_complete == n_reps:
+                job._finish(DONE)
+                return job
+
+            self._jobs[key] = job
+        self._threads.submit(self._run, job, backend, experiment, rc_period,
+                             n_jobs, warm_up)
+        return job
+
+    def _run(self, job, backend, experiment, rc_period, n_jobs, warm_up):
+        '''
+        Run a job in a background thread.
+        '''
+        status = DONE
+        error = None
+        try:
+            if job._cancel.is_set():
+                status = CANCELLED
+                return
+            job.status = RUNNING
+            # a request may extend the job while replications run
+            while status == DONE and not self._complete(job):
+                start_rep = job.n_complete
+                replications = backend.iter_replications(
+                    experiment, rc_period, job.n_reps - start_rep,
+                    n_jobs=n_jobs, executor=self.executor,
+                    start_rep=start_rep, warm_up=warm_up)
+                try:
+                    for rep, kpis in replications:
+                        job._add(rep, kpis)
+                        if job._cancel.is_set():
+                            status = CANCELLED
+                            break
+                finally:
+                    # cancels any replications not yet started
+                    replications.close()
+        except Exception as e:
+            status = FAILED
+            error = e
+        finally:
+            self._store(job, experiment, rc_period, warm_up)
+            with self._lock:
+                if self._jobs.get(job.key) is job:
+                    del self._jobs[job.key]
+            job._finish(status, error)
+
+    def _complete(self, job):
+        '''
+        Have all replications requested been run?  If so the job is
+        removed from the queue so that it can no longer be extended.
+        '''
+        with self._lock:
+            if job.n_complete < job.n_reps:
+                return False
+            if self._jobs.get(job.key) is job:
+                del self._jobs[job.key]
+            return True
+
+    def _store(self, job, experiment, rc_period, warm_up):
+        '''
+        Add the job's replications to the cache.  Only the first
+        consecutive replications are stored so a later job can run the
+        rest.
+        '''
+        results = job.results()
+        if results is None:
+            return
+        n_consecutive = 0
+        while n_consecutive + 1 in results.index:
+            n_consecutive += 1
+        if n_consecutive == 0:
+            return
+        self.cache.put_if_longer(job.key, results.loc[1:n_consecutive],
+                                 experiment_description(experiment,
+                                                        rc_period, warm_up))
+
+    def jobs(self):
+        '''
+        Jobs queued or running.
+
+        Returns:
+        -------
+        list of Job
+        '''
+        with self._lock:
+            return list(self._jobs.values())
+
+    def shutdown(self, cancel=True):
+        '''
+        Stop the queue.
+
+        Params:
+        ------
+        cancel: bool, optional (default=True)
+            Cancel jobs in progress.
+        '''
+        if cancel:
+            for job in self.jobs():
+                job._cancel.set()
+        self._threads.shutdown(wait=True)
@@ -0,0 +1,275 @@
+'''
+Precomputed results for the grid of scenarios in the app sidebar.
+
+`build_table` simulates every combination of operators, nurses and chance
+of callback offered by `app_to_deploy.py` and saves the results to a
+directory:
+
+* summary.npy: summary statistics (as `DataFrame.describe()`) of each KPI.
+  One column per statistic with a row per scenario, stored column by
+  column (shape = (n_columns, n_scenarios)).
+* replications.npy: (optional) the KPIs of every replication, shape =
+  (n_scenarios, n_reps, n_kpis) as float32.
+* metadata.json: the grid, run settings and column names.
+
+`LookupTable` memory maps the arrays and finds a scenario's row from its
+position in the grid, so a lookup does not read the rest of the file.
+
+Usage:
+
+    python lookup_table.py --output lookup_table --n-jobs -1
+'''
+import argparse
+import itertools
+import json
+import os
+import sys
+from concurrent.futures import as_completed
+from dataclasses import replace
+
+import numpy as np
+import pandas as pd
+
+import model
+
+# the sidebar grid of app_to_deploy.py
+OPERATORS = range(1, 21)
+NURSES = range(1, 16)
+CALLBACKS = tuple(np.round(np.arange(0.1, 1.0 + 1e-9, 0.05), 2).tolist())
+
+# default replications and seed used to build the table
+N_REPS = 100
+RANDOM_NUMBER_SET = 42
+
+# default location of the table
+LOOKUP_TABLE = 'lookup_table'
+
+# summary statistics stored for each KPI (as DataFrame.describe())
+STATISTICS = ('count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max')
+
+# decimal places used to match the chance of callback to the grid
+CALLBACK_DECIMALS = 2
+
+
+def _scenario_worker(spec, rc_period, n_reps, engine):
+    '''
+    Run the replications of a single scenario in a worker process.
+    '''
+    return model.multiple_replications(spec, rc_period, n_reps, n_jobs=1,
+                                       engine=engine)
+
+
+def build_table(path=LOOKUP_TABLE, operators=OPERATORS, nurses=NURSES,
+                callbacks=CALLBACKS, n_reps=N_REPS,
+                rc_period=model.RESULTS_COLLECTION_PERIOD,
+                random_number_set=RANDOM_NUMBER_SET,
+                store_replications=True, engine='fast', n_jobs=-1):
+    '''
+    Simulate every scenario in the grid and save the results.
+
+    All scenarios use the same random number streams.
+
+    Params:
+    ------
+    path: str, optional (default=LOOKUP_TABLE)
+        Directory to save the table to.  Created if needed.
+
+    operators, nurses, callbacks: iterable, optional
+        Grid values of n_operators, n_nurses and chance_callback.
+
+    n_reps: int, optional (default=N_REPS)
+        Number of replications of each scenario.
+
+    rc_period: float, optional (default=RESULTS_COLLECTION_PERIOD)
+        Run length of each replication.
+
+    random_number_set: int, optional (default=RANDOM_NUMBER_SET)
+        Root seed of the random number streams.
+
+    store_replications: bool, optional (default=True)
+        Save the KPIs of every replication as well as the summary.
+
+    engine: str, optional (default='fast')
+        The model engine used by `single_run`: 'simpy' or 'fast'.
+
+    n_jobs: int, optional (default=-1)
+        Number of worker processes.  -1 uses all available cores.
+    '''
+    callbacks = [round(float(p), CALLBACK_DECIMALS) for p in callbacks]
+    scenarios = list(itertools.product(operators, nurses, callbacks))
+    base = model.ExperimentSpec(random_number_set=random_number_set)
+    os.makedirs(path, exist_ok=True)
+
+    summary = None
+    replications = None
+    kpis = None
+    with model.create_executor(n_jobs) as executor:
+        futures = {}
+        for index, (n_operators, n_nurses, chance_callback) \
+                in enumerate(scenarios):
+            spec = replace(base, n_operators=n_operators, n_nurses=n_nurses,
+                           chance_callback=chance_callback)
+            future = executor.submit(_scenario_worker, spec, rc_period,
+                                     n_reps, engine)
+            futures[future] = index
+
+        for n_done, future in enumerate(as_completed(futures), 1):
+            results = future.result()
+            index = futures[future]
+
+            # arrays are created once the KPI names are known
+            if summary is None:
+                kpis = list(results.columns)
+                summary = np.lib.format.open_memmap(
+                    os.path.join(path, 'summary.npy'), mode='w+',
+                    dtype=np.float64,
+                    shape=(len(kpis) * len(STATISTICS), len(scenarios)))
+                if store_replications:
+                    replications = np.lib.format.open_memmap(
+                        os.path.join(path, 'replications.npy'), mode='w+',
+                        dtype=np.float32,
+                        shape=(len(scenarios), n_reps, len(kpis)))
+
+            described = results.describe().loc[list(STATISTICS), kpis]
+            summary[:, index] = described.to_numpy().T.ravel()
+            if store_replications:
+                replications[index] = results.to_numpy()
+
+            if n_done % 100 == 0 or n_done == len(scenarios):
+                print(f'{n_done} of {len(scenarios)} scenarios complete.')
+
+    summary.flush()
+    if store_replications:
+        replications.flush()
+
+    metadata = {'operators': list(operators), 'nurses': list(nurses),
+                'callbacks': callbacks, 'n_reps': n_reps,
+                'rc_period': rc_period,
+                'random_number_set': random_number_set, 'engine': engine,
+                'parameters': base.parameters(), 'kpis': kpis,
+                'statistics': list(STATISTICS),
+                'replications': store_replications}
+    with open(os.path.join(path, 'metadata.json'), 'w') as f:
+        json.dump(metadata, f, indent=2)
+
+
+class LookupTable():
+    '''
+    Read only access to a table created by `build_table`.
+    '''
+    def __init__(self, path=LOOKUP_TABLE):
+        '''
+        Constructor.  The arrays are memory mapped, not read.
+
+        Params:
+        ------
+        path: str, optional (default=LOOKUP_TABLE)
+            Directory containing the table.
+        '''
+        with open(os.path.join(path, 'metadata.json')) as f:
+            self.metadata = json.load(f)
+        self.n_reps = self.metadata['n_reps']
+        self.rc_period = self.metadata['rc_period']
+        self.kpis = self.metadata['kpis']
+        self.statistics = self.metadata['statistics']
+
+        # position of each grid value
+        self._operators = {n: i for i, n
+                           in enumerate(self.metadata['operators'])}
+        self._nurses = {n: i for i, n in enumerate(self.metadata['nurses'])}
+        self._callbacks = {p: i for i, p
+                           in enumerate(self.metadata['callbacks'])}
+
+        self.summary = np.load(os.path.join(path, 'summary.npy'),
+                               mmap_mode='r')
+        self.replications = None
+        if self.metadata['replications']:
+            self.replications = np.load(
+                os.path.join(path, 'replications.npy'), mmap_mode='r')
+
+    def index(self, n_operators, n_nurses, chance_callback):
+        '''
+        Row of a scenario in the table.
+
+        Returns:
+        -------
+        int or None (if the scenario is not in the grid)
+        '''
+        i = self._operators.get(n_operators)
+        j = self._nurses.get(n_nurses)
+        k = self._callbacks.get(round(float(chance_callback),
+                                      CALLBACK_DECIMALS))
+        if i is None or j is None or k is None:
+            return None
+        return (i * len(self._nurses) + j) * len(self._callbacks) + k
+
+    def describe(self, n_operators, n_nurses, chance_callback):
+        '''
+        Summary statistics of a scenario in the format of
+        `DataFrame.describe()`.
+
+        Returns:
+        -------
+        pandas.DataFrame or None (if the scenario is not in the grid)
+        '''
+        index = self.index(n_operators, n_nurses, chance_callback)
+        if index is None:
+            return None
+        values = np.asarray(self.summary[:, index])
+        return pd.DataFrame(values.reshape(len(self.kpis), -1).T,
+                            index=self.statistics, columns=self.kpis)
+
+    def results(self, n_operators, n_nurses, chance_callback, n_reps=None):
+        '''
+        KPIs of each replication of a scenario.
+
+        Params:
+        ------
+        n_reps: int, optional (default=None)
+            Number of replications to return.  None returns all.
+
+        Returns:
+        -------
+        pandas.DataFrame or None (if the scenario is not in the grid, the
+        replications are not stored or n_reps is more than the table has)
+        '''
+        n_reps = self.n_reps if n_reps is None else n_reps
+        index = self.index(n_operators, n_nurses, chance_callback)
+        if index is None or self.replications is None \
+                or n_reps > self.n_reps:
+            return None
+        results = pd.DataFrame(self.replications[index, :n_reps]
+                               .astype(np.float64), columns=self.kpis,
+                               index=pd.RangeIndex(1, n_reps + 1, name='rep'))
+        return results
+
+
+def main(argv=None):
+    '''
+    Build the lookup table from the command line.
+    '''
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--output', default=LOOKUP_TABLE,
+                        help='directory to save the table to')
+    parser.add_argument('--reps', type=int, default=N_REPS,
+                        help='replications of each scenario')
+    parser.add_argument('--seed', type=int, default=RANDOM_NUMBER_SET,
+                        help='random number set')
+    parser.add_argument('--engine', default='fast', choices=['simpy', 'fast'],
+                        help='model engine')
+    parser.add_argument('--n-jobs', type=int, default=-1,
+                        help='worker processes (-1 = all cores)')
+    parser.add_argument('--summary-only', action='store_true',
+                        help='do not store the KPIs of each replication')
+    args = parser.parse_args(argv)
+
+    build_table(args.output, n_reps=args.reps,
+                random_number_set=args.seed,
+                store_replications=not args.summary_only,
+                engine=args.engine, n_jobs=args.n_jobs)
+    print(f'Lookup table saved to {args.output}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
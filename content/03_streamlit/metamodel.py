@@ -0,0 +1,558 @@
+'''
+A surrogate (meta)model of the 111 call centre simulation.
+
+`Metamodel` fits a Gaussian process to the mean of each KPI of the
+scenarios that have already been simulated and predicts the KPIs of a new
+scenario, with uncertainty, in milliseconds.  The noise of each simulated
+mean (its variance across replications / number of replications) is
+included in the Gaussian process (stochastic kriging), so scenarios with
+few replications are trusted less.
+
+New results are added incrementally by extending the Cholesky factor of
+the covariance matrix.  The kernel hyperparameters are re-estimated every
+`refit_interval` new scenarios.
+
+`suggest` and `active_learning` pick the next scenarios to simulate where
+the metamodel is least certain.
+
+Usage:
+
+    metamodel = Metamodel()
+    metamodel.update_from_cache(cache, rc_period)
+    metamodel.predict({'n_operators': 14, 'n_nurses': 9,
+                       'chance_callback': 0.4})
+'''
+import copy
+import threading
+
+import numpy as np
+import pandas as pd
+from scipy.linalg import cho_solve, solve_triangular
+from scipy.optimize import minimize
+from scipy.stats import norm
+
+import model
+from output_analysis import ALPHA
+
+# experiment parameters used as inputs to the metamodel and their range
+FEATURES = {'n_operators': (1, 20),
+            'n_nurses': (1, 15),
+            'chance_callback': (0.1, 1.0)}
+
+# KPIs modelled on a log scale (positive and skewed)
+LOG_KPIS = ('01_mean_waiting_time', '03_mean_nurse_waiting_time')
+
+# parameters that identify results from a run, not the scenario
+IGNORED_PARAMETERS = ('random_number_set', 'random_seed',
+                      'monitor_resources')
+
+# number of new scenarios added before the hyperparameters are refitted
+REFIT_INTERVAL = 10
+
+# minimum number of scenarios before predictions are made
+MIN_SCENARIOS = 3
+
+# variance added to the diagonal of the covariance matrix for stability
+JITTER = 1e-8
+
+
+class GaussianProcess():
+    '''
+    Gaussian process regression with an anisotropic squared exponential
+    kernel and a known noise variance for each observation.
+
+    Inputs should be scaled to [0, 1].  Outputs are standardised
+    internally.
+    '''
+    def __init__(self):
+        '''
+        Constructor
+        '''
+        self.log_length_scales = None
+        self.log_signal_variance = 0.0
+        self.X = None
+        self.y = None
+        self.noise = None
+
+    def _kernel(self, A, B):
+        '''
+        Squared exponential covariance between the rows of A and B.
+        '''
+        length_scales = np.exp(self.log_length_scales)
+        diff = (A[:, None, :] - B[None, :, :]) / length_scales
+        return np.exp(self.log_signal_variance) \
+            * np.exp(-0.5 * (diff ** 2).sum(axis=2))
+
+    def _factorise(self):
+        '''
+        Cholesky factor of the covariance matrix and the weights used for
+        prediction.
+        '''
+        K = self._kernel(self.X, self.X)
+        K[np.diag_indices_from(K)] += self._noise_scaled + JITTER
+        self.L = np.linalg.cholesky(K)
+        self.alpha = cho_solve((self.L, True), self._y_scaled)
+
+    def _negative_log_likelihood(self, log_params):
+        '''
+        Negative log marginal likelihood for a set of hyperparameters.
+        '''
+        self.log_length_scales = log_params[:-1]
+        self.log_signal_variance = log_params[-1]
+        try:
+            self._factorise()
+        except np.linalg.LinAlgError:
+            return np.inf
+        return 0.5 * self._y_scaled @ self.alpha \
+            + np.log(np.diag(self.L)).sum()
+
+    def fit(self, X, y, noise, optimise=True):
+        '''
+        Fit the Gaussian process.
+
+        Params:
+        ------
+        X: np.ndarray
+            Inputs (n, d) scaled to [0, 1]
+
+        y: np.ndarray
+            Outputs (n,)
+
+        noise: np.ndarray
+            Noise variance of each output (n,)
+
+        optimise: bool, optional (default=True)
+            Estimate the hyperparameters by maximum likelihood.  If False
+            the current hyperparameters are used.
+        '''
+        self.X = np.asarray(X, dtype=np.float64)
+        self.y = np.asarray(y, dtype=np.float64)
+        self.noise = np.asarray(noise, dtype=np.float64)
+
+        # standardise outputs
+        self.y_mean = self.y.mean()
+        self.y_std = self.y.std() if self.y.std() > 0 else 1.0
+        self._y_scaled = (self.y - self.y_mean) / self.y_std
+        self._noise_scaled = self.noise / self.y_std ** 2
+
+        if self.log_length_scales is None:
+            self.log_length_scales = np.zeros(self.X.shape[1])
+
+        if optimise and len(self.y) > 1:
+            start = np.append(self.log_length_scales,
+                              self.log_signal_variance)
+            bounds = [(np.log(0.05), np.log(10.0))] * self.X.shape[1] \
+                + [(np.log(0.01), np.log(100.0))]
+            result = minimize(self._negative_log_likelihood, start,
+                              method='L-BFGS-B', bounds=bounds)
+            self.log_length_scales = result.x[:-1]
+            self.log_signal_variance = result.x[-1]
+        self._factorise()
+
+    def add(self, x, y, noise):
+        '''
+        Add an observation without refitting the hyperparameters or
+        output scaling.  The Cholesky factor is extended by one row.
+
+        Params:
+        ------
+        x: np.ndarray
+            Input (d,) scaled to [0, 1]
+
+        y: float
+            Output
+
+        noise: float
+            Noise variance of the output
+        '''
+        x = np.asarray(x, dtype=np.float64)[None, :]
+        k = self._kernel(self.X, x)[:, 0]
+        k_self = np.exp(self.log_signal_variance) \
+            + noise / self.y_std ** 2 + JITTER
+        row = solve_triangular(self.L, k, lower=True)
+        diagonal = np.sqrt(max(k_self - row @ row, JITTER))
+
+        n = len(self.y)
+        L = np.zeros((n + 1, n + 1))
+        L[:n, :n] = self.L
+        L[n, :n] = row
+        L[n, n] = diagonal
+        self.L = L
+
+        self.X = np.vstack([self.X, x])
+        self.y = np.append(self.y, y)
+        self.noise = np.append(self.noise, noise)
+        self._y_scaled = np.append(self._y_scaled,
+                                   (y - self.y_mean) / self.y_std)
+        self._noise_scaled = np.append(self._noise_scaled,
+                                       noise / self.y_std ** 2)
+        self.alpha = cho_solve((self.L, True), self._y_scaled)
+
+    def predict(self, X):
+        '''
+        Predictive mean and standard deviation of the underlying function
+        (excluding observation noise).
+
+        Params:
+        ------
+        X: np.ndarray
+            Inputs (m, d) scaled to [0, 1]
+
+        Returns:
+        -------
+        tuple (np.ndarray, np.ndarray)
+        '''
+        X = np.asarray(X, dtype=np.float64)
+        K_star = self._kernel(X, self.X)
+        mean = K_star @ self.alpha
+        v = solve_triangular(self.L, K_star.T, lower=True)
+        variance = np.exp(self.log_signal_variance) - (v ** 2).sum(axis=0)
+        std = np.sqrt(np.maximum(variance, 0.0))
+        return mean * self.y_std + self.y_mean, std * self.y_std
+
+
+class Metamodel():
+    '''
+    Gaussian process metamodels of the mean of each KPI.  Thread safe so
+    that one metamodel can be shared by all sessions of an app.
+    '''
+    def __init__(self, features=FEATURES, base=None,
+                 refit_interval=REFIT_INTERVAL, log_kpis=LOG_KPIS):
+        '''
+        Constructor
+
+        Params:
+        ------
+        features: dict, optional (default=FEATURES)
+            Experiment parameters used as inputs and their (low, high)
+            range.
+
+        base: dict, optional (default=None)
+            Values of the other experiment parameters.  Results from
+            experiments with different values are ignored.  If None the
+            `model.ExperimentSpec` defaults are used.
+
+        refit_interval: int, optional (default=REFIT_INTERVAL)
+            Number of new scenarios added incrementally before the
+            hyperparameters are refitted.
+
+        log_kpis: tuple, optional (default=LOG_KPIS)
+            KPIs modelled on a log scale.
+        '''
+        self.features = dict(features)
+        if base is None:
+            base = model.ExperimentSpec().parameters()
+        self.base = {name: value for name, value in base.items()
+                     if name not in self.features
+                     and name not in IGNORED_PARAMETERS}
+        self.refit_interval = refit_interval
+        self.log_kpis = log_kpis
+
+        self.kpis = None
+        self.scenarios = {}
+        self._processes = {}
+        self._n_incremental = 0
+        self._seen = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.scenarios)
+
+    def _scale(self, parameters):
+        '''
+        Scale the features of a scenario to [0, 1].
+        '''
+        return np.array([(parameters[name] - low) / (high - low)
+                         for name, (low, high) in self.features.items()])
+
+    def _observation(self, kpi, results):
+        '''
+        The (transformed) mean of a KPI and its noise variance.
+        '''
+        values = results[kpi].to_numpy(dtype=np.float64)
+        n = len(values)
+        mean = values.mean()
+        variance = values.var(ddof=1) / n if n > 1 else mean ** 2
+        if kpi in self.log_kpis:
+            # delta method variance of the log mean
+            mean = max(mean, 1e-6)
+            return np.log(mean), variance / mean ** 2
+        return mean, variance
+
+    def matches(self, parameters):
+        '''
+        Can results of an experiment with these parameters be used?
+
+        Params:
+        ------
+        parameters: dict
+            Experiment parameters
+
+        Returns:
+        -------
+        bool
+        '''
+        return all(name in parameters for name in self.features) and \
+            all(parameters.get(name, value) == value
+                for name, value in self.base.items())
+
+    def update(self, parameters, results):
+        '''
+        Add or replace the results of a scenario.
+
+        Params:
+        ------
+        parameters: dict
+            Experiment parameters.  Must include the features.
+
+        results: pandas.DataFrame
+            KPIs of each replication of the scenario.
+        '''
+        if not self.matches(parameters) or len(results) == 0:
+            return
+        scenario = tuple(parameters[name] for name in self.features)
+        with self._lock:
+            if self.kpis is None:
+                self.kpis = [kpi for kpi in results.columns]
+            replaced = scenario in self.scenarios
+            self.scenarios[scenario] = results[self.kpis].copy()
+
+            if replaced or not self._processes \
+                    or self._n_incremental + 1 >= self.refit_interval:
+                self._refit()
+            else:
+                x = self._scale(parameters)
+                for kpi, process in self._processes.items():
+                    process.add(x, *self._observation(kpi, results))
+                self._n_incremental += 1
+
+    def _refit(self):
+        '''
+        Refit all Gaussian processes (lock must be held).
+        '''
+        self._n_incremental = 0
+        if len(self.scenarios) < MIN_SCENARIOS:
+            self._processes = {}
+            return
+        X = np.array([self._scale(dict(zip(self.features, scenario)))
+                      for scenario in self.scenarios])
+        for kpi in self.kpis:
+            observations = [self._observation(kpi, results)
+                            for results in self.scenarios.values()]
+            y, noise = np.array(observations).T
+            process = self._processes.get(kpi, GaussianProcess())
+            process.fit(X, y, noise)
+            self._processes[kpi] = process
+
+    def update_from_cache(self, cache, rc_period, warm_up=0.0):
+        '''
+        Add results from a `ResultsCache` that are new or have more
+        replications than before.
+
+        Params:
+        ------
+        cache: ResultsCache
+            Cache of replication results
+
+        rc_period: float
+            Only results with this run length are used.
+
+        warm_up: float, optional (default=0.0)
+            Only results with this warm-up period are used.
+        '''
+        for key, description, results in cache.entries():
+            if description['rc_period'] != rc_period \
+                    or description['warm_up'] != warm_up \
+                    or self._seen.get(key) == len(results):
+                continue
+            self._seen[key] = len(results)
+            self.update(description['parameters'], results)
+
+    @property
+    def ready(self):
+        '''
+        Is the metamodel able to make predictions?
+        '''
+        return bool(self._processes)
+
+    def predict(self, parameters, alpha=ALPHA):
+        '''
+        Predict the mean of each KPI of a scenario.
+
+        Params:
+        ------
+        parameters: dict
+            Values of the features
+
+        alpha: float, optional (default=ALPHA)
+            Used to create 100(1 - alpha)% prediction intervals
+
+        Returns:
+        -------
+        pandas.DataFrame or None (if the metamodel is not ready)
+            prediction, std, lower_pi and upper_pi of each KPI.
+        '''
+        predictions = self.predict_many(pd.DataFrame([parameters]), alpha)
+        if predictions is None:
+            return None
+        return predictions.xs(0, level='scenario')
+
+    def predict_many(self, scenarios, alpha=ALPHA):
+        '''
+        Predict the mean of each KPI of several scenarios.
+
+        Params:
+        ------
+        scenarios: pandas.DataFrame
+            A row per scenario with a column for each feature.
+
+        alpha: float, optional (default=ALPHA)
+            Used to create 100(1 - alpha)% prediction intervals
+
+        Returns:
+        -------
+        pandas.DataFrame or None (if the metamodel is not ready)
+            prediction, std, lower_pi and upper_pi of each (scenario, KPI).
+        '''
+        X = np.array([self._scale(row) for row
+                      in scenarios[list(self.features)].to_dict('records')])
+        z = norm.ppf(1 - alpha / 2)
+        with self._lock:
+            if not self._processes:
+                return None
+            frames = {}
+            for kpi, process in self._processes.items():
+                mean, std = process.predict(X)
+                if kpi in self.log_kpis:
+                    # back transform: median and approximate std
+                    prediction = np.exp(mean)
+                    frames[kpi] = pd.DataFrame(
+                        {'prediction': prediction, 'std': prediction * std,
+                         'lower_pi': np.exp(mean - z * std),
+                         'upper_pi': np.exp(mean + z * std)})
+                else:
+                    frames[kpi] = pd.DataFrame(
+                        {'prediction': mean, 'std': std,
+                         'lower_pi': mean - z * std,
+                         'upper_pi': mean + z * std})
+        predictions = pd.concat(frames, names=['kpi', 'scenario'])
+        return predictions.swaplevel().sort_index()
+
+    def suggest(self, candidates, n=1):
+        '''
+        Select the candidate scenarios the metamodel is least certain
+        about.  After each selection the scenario is added to a copy of
+        the metamodel with its predicted value (so the uncertainty near
+        it falls) and the next is selected.
+
+        Params:
+        ------
+        candidates: pandas.DataFrame
+            A row per scenario with a column for each feature.
+
+        n: int, optional (default=1)
+            Number of scenarios to select.
+
+        Returns:
+        -------
+        pandas.DataFrame
+            The selected rows of candidates.  If the metamodel is not
+            ready, a random sample.
+        '''
+        if not self.ready:
+            return candidates.sample(n, random_state=0)
+
+        with self._lock:
+            processes = copy.deepcopy(self._processes)
+        X = np.array([self._scale(row) for row
+                      in candidates[list(self.features)].to_dict('records')])
+
+        selected = []
+        for _ in range(min(n, len(candidates))):
+            # total uncertainty relative to each KPI's spread
+            score = np.zeros(len(X))
+            for process in processes.values():
+                _, std = process.predict(X)
+                score += (std / process.y_std) ** 2
+            score[selected] = -np.inf
+            best = int(np.argmax(score))
+            selected.append(best)
+            for process in processes.values():
+                mean, _ = process.predict(X[[best]])
+                process.add(X[best], mean[0], 0.0)
+        return candidates.iloc[selected]
+
+
+def grid(features=FEATURES, n=5):
+    '''
+    Evenly spaced candidate scenarios.  Integer features are rounded.
+
+    Params:
+    ------
+    features: dict, optional (default=FEATURES)
+        Features and their (low, high) range
+
+    n: int, optional (default=5)
+        Number of values of each feature
+
+    Returns:
+    -------
+    pandas.DataFrame
+    '''
+    values = []
+    for low, high in features.values():
+        points = np.linspace(low, high, n)
+        if isinstance(low, int) and isinstance(high, int):
+            points = np.unique(np.round(points).astype(int))
+        values.append(points)
+    index = pd.MultiIndex.from_product(values, names=list(features))
+    return index.to_frame(index=False)
+
+
+def active_learning(metamodel, candidates, n_iterations=5, batch_size=4,
+                    n_reps=10, rc_period=model.RESULTS_COLLECTION_PERIOD,
+                    run=model.multiple_replications, **kwargs):
+    '''
+    Improve a metamodel by repeatedly simulating the candidate scenarios
+    it is least certain about.
+
+    Params:
+    ------
+    metamodel: Metamodel
+        The metamodel to improve.  Updated in place.
+
+    candidates: pandas.DataFrame
+        A row per scenario with a column for each feature.
+
+    n_iterations: int, optional (default=5)
+        Number of rounds of selection and simulation.
+
+    batch_size: int, optional (default=4)
+        Number of scenarios simulated in each round.
+
+    n_reps: int, optional (default=10)
+        Replications of each selected scenario.
+
+    rc_period: float, optional (default=RESULTS_COLLECTION_PERIOD)
+        Run length of each replication.
+
+    run: callable, optional (default=model.multiple_replications)
+        Called as run(experiment, rc_period, n_reps, **kwargs).
+
+    **kwargs:
+        passed to `run` e.g. engine='fast'.
+
+    Returns:
+    -------
+    pandas.DataFrame
+        The scenarios simulated.
+    '''
+    simulated = []
+    for _ in range(n_iterations):
+        selected = metamodel.suggest(candidates, batch_size)
+        for parameters in selected.to_dict('records'):
+            spec = model.ExperimentSpec(**{**metamodel.base, **parameters})
+            results = run(spec, rc_period, n_reps, **kwargs)
+            metamodel.update(spec.parameters(), results)
+            simulated.append(parameters)
+    return pd.DataFrame(simulated)
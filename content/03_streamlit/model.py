@@ -12,6 +12,16 @@ import numpy as np
 import pandas as pd
 import simpy
 import itertools
+import heapq
+from contextlib import nullcontext
+from dataclasses import dataclass, fields, replace
+from typing import Optional
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from scipy.stats import t
+
+from output_analysis import OnlineStatistics, SampleStatistics, ALPHA, mser5
+from event_log import EventLog
+from tracing import Tracer, PrintSink
 
 # CONSTANTS AND MODULE LEVEL VARIABLES #########################################
 
@@ -40,11 +50,43 @@ CALL_SEED = 101
 CALLBACK_SEED = 1966
 NURSE_SEED = 2020
 
-# Boolean switch to simulation results as the model runs
+# Boolean switch to print simulation events as the model runs.  Used when
+# single_run is not passed a tracer.
 TRACE = False
 
 # run variables
 RESULTS_COLLECTION_PERIOD = 1000
+WARM_UP = 0.0
+
+# default length and number of the pilot runs used to select a warm-up
+# period, and the interval waiting times are averaged over
+PILOT_PERIOD = 5000
+PILOT_REPS = 20
+PILOT_INTERVAL = 10.0
+
+# sequential replication defaults
+TARGET_HALF_WIDTH = 0.05
+MIN_REPS = 5
+MAX_REPS = 1000
+BATCH_SIZE = 10
+
+# default number of parallel worker processes (1 = run in serial)
+N_JOBS = 1
+
+# number of random number streams used in a single replication
+N_STREAMS = 4
+
+# number of samples drawn at once by a buffered distribution
+BLOCK_SIZE = 4096
+
+# fields recorded for each caller in the (optional) event log
+CALLER_LOG_DTYPE = np.dtype([('caller', np.int64),
+                             ('arrival_time', np.float64),
+                             ('operator_wait', np.float64),
+                             ('call_duration', np.float64),
+                             ('callback', np.int8),
+                             ('nurse_wait', np.float64),
+                             ('nurse_call_duration', np.float64)])
 
 # DISTRIBUTION CLASSES #########################################################
 
@@ -210,6 +252,113 @@ class Exponential():
         '''
         return self.rand.exponential(self.mean, size=size)
 
+class Buffered():
+    '''
+    Wraps a distribution and draws samples in large blocks using a single
+    vectorised call.  Single samples are then returned from the buffer 
+    and the buffer is refilled when it is empty.
+
+    The sequence of samples returned is identical to calling 
+    `dist.sample(size=block_size)` repeatedly.
+    '''
+    def __init__(self, dist, block_size=BLOCK_SIZE):
+        '''
+        Constructor
+
+        Params:
+        ------
+        dist: object
+            A distribution object with a sample(size) method.
+
+        block_size: int, optional (default=BLOCK_SIZE)
+            The number of samples to draw each time the buffer is refilled.
+        '''
+        self.dist = dist
+        self.block_size = block_size
+        self._buffer = iter(())
+
+    def _refill(self):
+        '''
+        Draw a new block of samples from the distribution.
+        '''
+        self._buffer = iter(self.dist.sample(self.block_size).tolist())
+
+    def sample(self, size=None):
+        '''
+        Generate a sample from the buffered distribution
+        
+        Params:
+        -------
+        size: int, optional (default=None)
+            the number of samples to return.  If size=None then a single
+            sample is returned.
+            
+        Returns:
+        -------
+        float or np.ndarray (if size >=1)
+        '''
+        if size is None:
+            try:
+                return next(self._buffer)
+            except StopIteration:
+                self._refill()
+                return next(self._buffer)
+
+        samples = list(itertools.islice(self._buffer, size))
+        while len(samples) < size:
+            self._refill()
+            samples.extend(itertools.islice(self._buffer, 
+                                            size - len(samples)))
+        return np.array(samples)
+
+# RANDOM NUMBER STREAMS #######################################################
+
+class ReplicationStreams():
+    '''
+    Manages the random number streams used by replications of the model.
+
+    Uses `numpy.random.SeedSequence.spawn` to give each (replication, 
+    distribution) pair its own independent stream.  Replication `rep` 
+    always receives the same streams so replications can be run in any 
+    order, in parallel, or on their own.
+    '''
+    def __init__(self, random_number_set=None, n_streams=N_STREAMS):
+        '''
+        Constructor
+        
+        Params:
+        ------
+        random_number_set: int, optional (default=None)
+            Root seed for all replications. If set to None then unique 
+            entropy is created and stored.
+
+        n_streams: int, optional (default=N_STREAMS)
+            The number of streams (distributions) in a replication.
+        '''
+        self.seed_sequence = np.random.SeedSequence(random_number_set)
+        self.n_streams = n_streams
+
+    def spawn(self, rep):
+        '''
+        Return the seeds for each stream in a replication.
+
+        This is equivalent to taking the `rep`th child of 
+        `seed_sequence.spawn()`, but does not need to spawn the children 
+        of earlier replications.
+        
+        Params:
+        -------
+        rep: int
+            The replication number (zero indexed).
+
+        Returns:
+        -------
+        list of numpy.random.SeedSequence
+        '''
+        rep_sequence = np.random.SeedSequence(
+            self.seed_sequence.entropy,
+            spawn_key=self.seed_sequence.spawn_key + (rep,))
+        return rep_sequence.spawn(self.n_streams)
 
 # EXPERIMENT CLASS ############################################################
 
@@ -222,25 +371,66 @@ class Experiment:
                  call_high=CALL_HIGH, chance_callback=CHANCE_CALLBACK, 
                  nurse_call_low=NURSE_CALL_LOW, nurse_call_high=NURSE_CALL_HIGH,
                  arrival_seed=None, call_seed=None,
-                 callback_seed=None, nurse_seed=None):
+                 callback_seed=None, nurse_seed=None,
+                 random_number_set=None, buffered=False, 
+                 block_size=BLOCK_SIZE, store_samples=False, quantiles=(),
+                 log_callers=False, monitor_resources=False):
         '''
         The init method sets up our defaults, resource counts, distributions
         and result collection objects.
+
+        If `buffered` is True then each distribution draws `block_size`
+        samples at a time (see `Buffered`).
+
+        Waiting times are summarised as the model runs in constant memory 
+        (see `OnlineStatistics`) with optional streaming `quantiles`.  Set
+        `store_samples` to True to also keep every waiting time.
+
+        If `log_callers` is True the times of each caller are recorded in
+        an `EventLog` (results['event_log']).  Callback is -1 if unknown.
+
+        If `monitor_resources` is True the time-weighted queue length and
+        utilisation of the operators and nurses are also reported (see
+        `MonitoredResource`).
+
+        `random_number_set` is the root seed of the random number streams 
+        used by each replication. If set to None then unique streams are
+        created for this experiment.
         '''
-        # no. resources
-        self.n_operators = n_operators
-        self.n_nurses = n_nurses
+        # no. resources (e.g. 13.0 when read from a csv file)
+        self.n_operators = int(n_operators)
+        self.n_nurses = int(n_nurses)
+
+        # store distribution parameters so that a worker process can 
+        # recreate the distributions with new seeds.
+        self.mean_iat = mean_iat
+        self.call_low = call_low
+        self.call_mode = call_mode
+        self.call_high = call_high
+        self.chance_callback = chance_callback
+        self.nurse_call_low = nurse_call_low
+        self.nurse_call_high = nurse_call_high
+
+        # independent random number streams for each replication
+        self.random_number_set = random_number_set
+        self.streams = ReplicationStreams(random_number_set)
+
+        # sample distributions in blocks
+        self.buffered = buffered
+        self.block_size = block_size
+
+        # waiting time results collection
+        self.store_samples = store_samples
+        self.quantiles = quantiles
+        self.log_callers = log_callers
+        self.monitor_resources = monitor_resources
 
         # create distribution objects
-        self.arrival_dist = Exponential(mean_iat, random_seed=arrival_seed)
-        self.call_dist = Triangular(call_low, call_mode, call_high, 
-                                    random_seed=call_seed)
-        
-        self.callback_dist = Bernoulli(chance_callback, 
-                                       random_seed=callback_seed)
-        
-        self.nurse_dist = Uniform(nurse_call_low, nurse_call_high, 
-                                  random_seed=nurse_seed)
+        self.arrival_seed = arrival_seed
+        self.call_seed = call_seed
+        self.callback_seed = callback_seed
+        self.nurse_seed = nurse_seed
+        self.init_sampling(arrival_seed, call_seed, callback_seed, nurse_seed)
 
         # resources
         # these variable are placeholders. 
@@ -249,6 +439,61 @@ class Experiment:
         
         # initialise results to zero
         self.init_results_variables()
+
+    def init_sampling(self, arrival_seed=None, call_seed=None, 
+                      callback_seed=None, nurse_seed=None):
+        '''
+        Create the distributions used by the model using the seeds provided.
+
+        Params:
+        ------
+        arrival_seed, call_seed, callback_seed, nurse_seed: int or 
+        numpy.random.SeedSequence, optional (default=None)
+            Seeds for the arrival, call duration, nurse callback and
+            nurse consultation distributions.
+        '''
+        self.arrival_dist = Exponential(self.mean_iat, 
+                                        random_seed=arrival_seed)
+        self.call_dist = Triangular(self.call_low, self.call_mode, 
+                                    self.call_high, random_seed=call_seed)
+        
+        self.callback_dist = Bernoulli(self.chance_callback, 
+                                       random_seed=callback_seed)
+        
+        self.nurse_dist = Uniform(self.nurse_call_low, self.nurse_call_high, 
+                                  random_seed=nurse_seed)
+
+        if self.buffered:
+            self.arrival_dist = Buffered(self.arrival_dist, self.block_size)
+            self.call_dist = Buffered(self.call_dist, self.block_size)
+            self.callback_dist = Buffered(self.callback_dist, 
+                                          self.block_size)
+            self.nurse_dist = Buffered(self.nurse_dist, self.block_size)
+
+    def set_replication(self, rep):
+        '''
+        Recreate the distributions using the random number streams of 
+        replication `rep`.
+
+        Params:
+        ------
+        rep: int
+            The replication number (zero indexed).
+        '''
+        self.init_sampling(*self.streams.spawn(rep))
+
+    def parameters(self):
+        '''
+        The input parameters of the experiment.  Used to identify an 
+        experiment e.g. when caching results.  The same as the parameters
+        of its spec: an experiment without a random number set is
+        identified by the entropy of its streams.
+
+        Returns:
+        -------
+        dict
+        '''
+        return self.spec().parameters()
         
     def init_results_variables(self):
         '''
@@ -258,30 +503,242 @@ class Experiment:
         '''
         # variable used to store results of experiment
         self.results = {}
-        self.results['waiting_times'] = []
+        self.results['waiting_times'] = self.create_collector()
         
         # total operator usage time for utilisation calculation.
         self.results['total_call_duration'] = 0.0
 
         # nurse sub process results collection
-        self.results['nurse_waiting_times'] = []
+        self.results['nurse_waiting_times'] = self.create_collector()
         self.results['total_nurse_call_duration'] = 0.0
 
-# SIMPY MODEL LOGIC #########################################################
+        # optional per caller event log
+        self.results['event_log'] = None
+        if self.log_callers:
+            self.results['event_log'] = EventLog(CALLER_LOG_DTYPE,
+                                                 defaults={'callback': -1})
+
+        # optional time-weighted resource statistics (set at end of run)
+        self.results['operator_statistics'] = None
+        self.results['nurse_statistics'] = None
+
+    def create_collector(self):
+        '''
+        Create an object to collect waiting times during a run.
 
-def trace(msg):
+        Returns:
+        -------
+        OnlineStatistics or SampleStatistics (if store_samples is True)
+        '''
+        if self.store_samples:
+            return SampleStatistics(self.quantiles)
+        return OnlineStatistics(self.quantiles)
+
+    def __getstate__(self):
+        '''
+        Simpy resources are bound to a simulation environment and cannot be
+        pickled.  Drop them when an experiment is sent to a worker process.
+        '''
+        state = self.__dict__.copy()
+        state['operators'] = None
+        state['nurses'] = None
+        return state
+
+    def spec(self):
+        '''
+        The immutable specification of this experiment.  Replications of
+        the spec use the same random number streams as the experiment.
+
+        Returns:
+        -------
+        ExperimentSpec
+        '''
+        values = {field.name: getattr(self, field.name) 
+                  for field in fields(ExperimentSpec)}
+        values['random_number_set'] = self.streams.seed_sequence.entropy
+        return ExperimentSpec(**values)
+
+@dataclass(frozen=True)
+class ExperimentSpec:
     '''
-    Turing printing of events on and off.
-    
+    Immutable and hashable specification of an experiment.  Takes the
+    same parameters as `Experiment`.
+
+    A spec holds no run state, so it can be shared between threads and
+    user sessions and used as a cache key.  Each run of the model creates
+    its own run context (a private `Experiment` holding the distributions,
+    resources and results) with `create_context`.
+
+    If `random_number_set` is None each run context creates unique 
+    streams.
+    '''
+    n_operators: int = N_OPERATORS
+    n_nurses: int = N_NURSES
+    mean_iat: float = MEAN_IAT
+    call_low: float = CALL_LOW
+    call_mode: float = CALL_MODE
+    call_high: float = CALL_HIGH
+    chance_callback: float = CHANCE_CALLBACK
+    nurse_call_low: float = NURSE_CALL_LOW
+    nurse_call_high: float = NURSE_CALL_HIGH
+    arrival_seed: Optional[int] = None
+    call_seed: Optional[int] = None
+    callback_seed: Optional[int] = None
+    nurse_seed: Optional[int] = None
+    random_number_set: Optional[int] = None
+    buffered: bool = False
+    block_size: int = BLOCK_SIZE
+    store_samples: bool = False
+    quantiles: tuple = ()
+    log_callers: bool = False
+    monitor_resources: bool = False
+
+    def __post_init__(self):
+        # quantiles are stored as a tuple so the spec is hashable
+        object.__setattr__(self, 'quantiles', tuple(self.quantiles))
+
+        # resource counts may be floats e.g. when read from a csv file
+        object.__setattr__(self, 'n_operators', int(self.n_operators))
+        object.__setattr__(self, 'n_nurses', int(self.n_nurses))
+
+    def create_context(self, rep=None):
+        '''
+        Create the run context for a single run of the model.
+
+        Params:
+        ------
+        rep: int, optional (default=None)
+            Replication number (zero indexed).  Selects the random number
+            streams.  If None the fixed seeds of the spec are used.
+
+        Returns:
+        -------
+        Experiment
+            A new experiment that is only used by one run.
+        '''
+        context = Experiment(**{field.name: getattr(self, field.name)
+                                for field in fields(self)})
+        if rep is not None:
+            context.set_replication(rep)
+        return context
+
+    def parameters(self):
+        '''
+        The input parameters of the experiment.  Used to identify an
+        experiment e.g. when caching results.
+
+        Returns:
+        -------
+        dict
+        '''
+        return {'n_operators': self.n_operators,
+                'n_nurses': self.n_nurses,
+                'mean_iat': self.mean_iat,
+                'call_low': self.call_low,
+                'call_mode': self.call_mode,
+                'call_high': self.call_high,
+                'chance_callback': self.chance_callback,
+                'nurse_call_low': self.nurse_call_low,
+                'nurse_call_high': self.nurse_call_high,
+                'random_number_set': self.random_number_set,
+                'monitor_resources': self.monitor_resources}
+
+def experiment_spec(experiment):
+    '''
+    Return the spec of an `Experiment` or `ExperimentSpec`.
+
     Params:
+    ------
+    experiment: Experiment or ExperimentSpec
+
+    Returns:
     -------
-    msg: str
-        string to print to screen.
+    ExperimentSpec
+    '''
+    if isinstance(experiment, ExperimentSpec):
+        return experiment
+    return experiment.spec()
+
+# RESOURCE MONITORING #######################################################
+
+class MonitoredResource(simpy.Resource):
+    '''
+    A simpy resource that keeps time-weighted statistics of the number of
+    busy servers and the queue length.
+
+    The areas under the busy servers and queue length curves are updated
+    only when the resource state can change (requests and releases), so
+    no sampling process is added to the simulation.
     '''
-    if TRACE:
-        print(msg)
+    def __init__(self, env, capacity=1):
+        '''
+        Constructor
+
+        Params:
+        ------
+        env: simpy.Environment
+            The simulation environment
+
+        capacity: int, optional (default=1)
+            Number of servers
+        '''
+        super().__init__(env, capacity)
+        self.reset()
+
+    def reset(self):
+        '''
+        Discard statistics collected so far e.g. at the end of a warm-up.
+        '''
+        self.start_time = self._env.now
+        self.busy_area = 0.0
+        self.queue_area = 0.0
+        self.peak_queue = len(self.queue)
+        self._last_time = self._env.now
+        self._busy = len(self.users)
+        self._queue_length = len(self.queue)
+
+    def _update(self):
+        '''
+        Add the time since the last update to the areas and record the
+        current state.
+        '''
+        elapsed = self._env.now - self._last_time
+        self.busy_area += self._busy * elapsed
+        self.queue_area += self._queue_length * elapsed
+        self._last_time = self._env.now
+        self._busy = len(self.users)
+        self._queue_length = len(self.queue)
+
+    def _trigger_put(self, get_event):
+        self._update()
+        super()._trigger_put(get_event)
+        self._update()
+        self.peak_queue = max(self.peak_queue, self._queue_length)
 
-def service(identifier, args, env):
+    def _trigger_get(self, put_event):
+        self._update()
+        super()._trigger_get(put_event)
+        self._update()
+
+    def statistics(self):
+        '''
+        Time-weighted statistics since the last reset.
+
+        Returns:
+        -------
+        dict
+            mean_queue, peak_queue and utilisation (%).
+        '''
+        self._update()
+        duration = self._env.now - self.start_time
+        return {'mean_queue': self.queue_area / duration,
+                'peak_queue': self.peak_queue,
+                'utilisation': self.busy_area
+                               / (self.capacity * duration) * 100.0}
+
+# SIMPY MODEL LOGIC #########################################################
+
+def service(identifier, args, env, tracer=None):
     '''
     simulates the service process for a call operator 
     and nurse.
@@ -304,10 +761,17 @@ def service(identifier, args, env):
     env: simpy.Environment
         The current environent the simulation is running in
         We use this to pause and restart the process after a delay.
-    
+
+    tracer: tracing.Tracer, optional (default=None)
+        Receives the caller's events.  If None nothing is traced.
     '''
     # record the time that call entered the queue
     start_wait = env.now
+
+    # optional event log for the caller
+    log = args.results['event_log']
+    if log is not None:
+        row = log.append(caller=identifier, arrival_time=start_wait)
     
     # request an operator
     with args.operators.request() as req:
@@ -317,10 +781,12 @@ def service(identifier, args, env):
         waiting_time = env.now - start_wait
         
         # store the results for an experiment 
-        args.results['waiting_times'].append(waiting_time)
+        args.results['waiting_times'].update(waiting_time)
+        if log is not None:
+            log.record(row, 'operator_wait', waiting_time)
 
-        trace(f'operator answered call {identifier} at ' \
-              + f'{env.now:.3f}')
+        if tracer is not None:
+            tracer.emit('operator_answered', env.now, caller=identifier)
 
         # the sample distribution is defined by the experiment.
         call_duration = args.call_dist.sample()       
@@ -330,16 +796,22 @@ def service(identifier, args, env):
         
         # update the total call_duration 
         args.results['total_call_duration'] += call_duration
+        if log is not None:
+            log.record(row, 'call_duration', call_duration)
         
         # print out information for patient.
-        trace(f'call {identifier} ended {env.now:.3f}; ' \
-              + f'waiting time was {waiting_time:.3f}')
+        if tracer is not None:
+            tracer.emit('call_ended', env.now, caller=identifier,
+                        waiting_time=waiting_time)
         
     # nurse callback
     callback_patient = args.callback_dist.sample()
+    if log is not None:
+        log.record(row, 'callback', callback_patient)
 
     if callback_patient:
-        trace(f'Patient {identifier} waiting for nurse call back')
+        if tracer is not None:
+            tracer.emit('nurse_callback', env.now, caller=identifier)
 
         start_nurse_wait = env.now
 
@@ -349,23 +821,27 @@ def service(identifier, args, env):
 
             # record the waiting time for nurse call back
             nurse_waiting_time = env.now - start_nurse_wait
-            args.results['nurse_waiting_times'].append(nurse_waiting_time)
+            args.results['nurse_waiting_times'].update(nurse_waiting_time)
+            if log is not None:
+                log.record(row, 'nurse_wait', nurse_waiting_time)
 
             # sample nurse the duration of the nurse consultation
             nurse_call_duration = args.nurse_dist.sample()       
 
-            trace(f'nurse called back patient {identifier} at ' \
-              + f'{env.now:.3f}')
+            if tracer is not None:
+                tracer.emit('nurse_answered', env.now, caller=identifier)
 
             # schedule process to begin again after call duration
             yield env.timeout(nurse_call_duration)
 
             args.results['total_nurse_call_duration'] += nurse_call_duration
+            if log is not None:
+                log.record(row, 'nurse_call_duration', nurse_call_duration)
 
-            trace(f'nurse consultation for {identifier}' \
-              + f' competed at {env.now:.3f}')
+            if tracer is not None:
+                tracer.emit('nurse_ended', env.now, caller=identifier)
 
-def arrivals_generator(env, args):
+def arrivals_generator(env, args, tracer=None):
     '''
     IAT is exponentially distributed
 
@@ -376,6 +852,10 @@ def arrivals_generator(env, args):
 
     args: Experiment
         The settings and input parameters for the simulation.
+
+    tracer: tracing.Tracer, optional (default=None)
+        Receives arrival events and is passed to each caller's service
+        process.  If None nothing is traced.
     '''
 
     # use itertools as it provides an infinite loop 
@@ -386,47 +866,326 @@ def arrivals_generator(env, args):
         inter_arrival_time = args.arrival_dist.sample()
         yield env.timeout(inter_arrival_time)
 
-        trace(f'call arrives at: {env.now:.3f}')
+        if tracer is not None:
+            tracer.emit('arrival', env.now, caller=caller_count)
 
         # we pass the experiment to the service function
-        env.process(service(caller_count, args, env))
+        env.process(service(caller_count, args, env, tracer))
+
+def warm_up_complete(env, warm_up, args, tracer=None):
+    '''
+    Reset results collection at the end of the warm-up period.  Statistics
+    from the warm-up period are discarded.
+
+    Params:
+    -------
+    env: simpy.Environment
+        The simpy environment for the simulation
+
+    warm_up: float
+        Length of the warm-up period
+
+    args: Experiment
+        The settings and input parameters for the simulation.
+
+    tracer: tracing.Tracer, optional (default=None)
+        Receives the end of warm-up event.  If None nothing is traced.
+    '''
+    yield env.timeout(warm_up)
+    args.init_results_variables()
+    if args.monitor_resources:
+        args.operators.reset()
+        args.nurses.reset()
+    if tracer is not None:
+        tracer.emit('warm_up_complete', env.now)
+
+# FAST ENGINE ###############################################################
+
+def multi_server_queue(arrival_times, durations, n_servers):
+    '''
+    Service start times for a first-in-first-out multi-server queue.
+
+    Uses the Kiefer-Wolfowitz recursion: a heap holds the time each server
+    next becomes free and each arrival (in order) is served by the server
+    that is free first.
+
+    Params:
+    ------
+    arrival_times: np.ndarray
+        Sorted times that customers join the queue.
+
+    durations: np.ndarray
+        Service durations of each customer.
+
+    n_servers: int
+        Number of servers.
+
+    Returns:
+    -------
+    np.ndarray
+    '''
+    free_times = [0.0] * n_servers
+    start_times = []
+    for arrival, duration in zip(arrival_times.tolist(), 
+                                 durations.tolist()):
+        start = max(arrival, free_times[0])
+        heapq.heapreplace(free_times, start + duration)
+        start_times.append(start)
+    return np.array(start_times)
+
+def queue_statistics(arrival_times, start_times, end_times, n_servers,
+                     period_start, period_end):
+    '''
+    Time-weighted statistics of a multi-server queue over a period.  The
+    fast engine equivalent of `MonitoredResource.statistics`.
+
+    Params:
+    ------
+    arrival_times, start_times, end_times: np.ndarray
+        Arrival, service start and service end time of each customer.
+
+    n_servers: int
+        Number of servers
+
+    period_start, period_end: float
+        The period the statistics are collected over.
+
+    Returns:
+    -------
+    dict
+        mean_queue, peak_queue and utilisation (%).
+    '''
+    duration = period_end - period_start
+
+    # time each customer spends queuing and in service during the period
+    queue_area = (np.clip(start_times, period_start, period_end)
+                  - np.clip(arrival_times, period_start, period_end)).sum()
+    busy_area = (np.clip(end_times, period_start, period_end)
+                 - np.clip(start_times, period_start, period_end)).sum()
+
+    # queue length after each arrival (+1) and service start (-1).  Starts
+    # are processed first when they occur at the same time.
+    times = np.concatenate([arrival_times, start_times])
+    changes = np.concatenate([np.ones(len(arrival_times), dtype=np.int64),
+                              -np.ones(len(start_times), dtype=np.int64)])
+    order = np.lexsort((changes, times))
+    times = times[order]
+    queue_length = np.cumsum(changes[order])
+    first, last = np.searchsorted(times, [period_start, period_end])
+    peak_queue = queue_length[first - 1] if first > 0 else 0
+    if last > first:
+        peak_queue = max(peak_queue, queue_length[first:last].max())
+
+    return {'mean_queue': queue_area / duration,
+            'peak_queue': int(peak_queue),
+            'utilisation': busy_area / (n_servers * duration) * 100.0}
+
+def fast_model(args, rc_period, warm_up=0.0):
+    '''
+    Alternative to the simpy model for the 111 call centre.  All arrivals
+    and service times are sampled upfront with numpy and the operator and 
+    nurse queues are solved with `multi_server_queue`.  Results are stored 
+    in the experiment in the same way as the simpy model.
+
+    Params:
+    ------
+    args: Experiment
+        The settings and input parameters for the simulation.
+
+    rc_period: float
+        Results collection period.
+
+    warm_up: float, optional (default=0.0)
+        Results are only collected after the warm-up period.
+    '''
+    run_length = warm_up + rc_period
+
+    # sample inter-arrival times until the end of the run
+    inter_arrival_times = []
+    block_size = int(run_length / args.mean_iat * 1.1) + 100
+    total_time = 0.0
+    while total_time < run_length:
+        block = args.arrival_dist.sample(block_size)
+        inter_arrival_times.append(block)
+        total_time += block.sum()
+    arrival_times = np.cumsum(np.concatenate(inter_arrival_times))
+    arrival_times = arrival_times[arrival_times < run_length]
+
+    # operator queue
+    call_durations = args.call_dist.sample(len(arrival_times))
+    call_starts = multi_server_queue(arrival_times, call_durations, 
+                                     args.n_operators)
+    call_ends = call_starts + call_durations
+    
+    # callers answered and completed during the run
+    answered = call_starts < run_length
+    completed = call_ends < run_length
+    
+    # nurse callbacks join the nurse queue as their call ends.
+    end_order = np.flatnonzero(completed)
+    end_order = end_order[np.argsort(call_ends[end_order], kind='stable')]
+    callback = args.callback_dist.sample(len(end_order)) == 1
+    nurse_callers = end_order[callback]
+    nurse_arrivals = call_ends[nurse_callers]
+
+    # nurse queue
+    nurse_durations = args.nurse_dist.sample(len(nurse_arrivals))
+    nurse_starts = multi_server_queue(nurse_arrivals, nurse_durations,
+                                      args.n_nurses)
+    nurse_ends = nurse_starts + nurse_durations
+    nurse_answered = nurse_starts < run_length
+    nurse_completed = nurse_ends < run_length
+
+    # results collection after the warm-up period
+    collect = answered & (call_starts >= warm_up)
+    args.results['waiting_times'].extend(
+        call_starts[collect] - arrival_times[collect])
+    collect = completed & (call_ends >= warm_up)
+    args.results['total_call_duration'] = call_durations[collect].sum()
+
+    collect = nurse_answered & (nurse_starts >= warm_up)
+    args.results['nurse_waiting_times'].extend(
+        nurse_starts[collect] - nurse_arrivals[collect])
+    collect = nurse_completed & (nurse_ends >= warm_up)
+    args.results['total_nurse_call_duration'] = \
+        nurse_durations[collect].sum()
+
+    # optional time-weighted resource statistics
+    if args.monitor_resources:
+        args.results['operator_statistics'] = queue_statistics(
+            arrival_times, call_starts, call_ends, args.n_operators,
+            warm_up, run_length)
+        args.results['nurse_statistics'] = queue_statistics(
+            nurse_arrivals, nurse_starts, nurse_ends, args.n_nurses,
+            warm_up, run_length)
+
+    # optional event log of callers arriving after the warm-up period
+    log = args.results['event_log']
+    if log is not None:
+        logged = arrival_times >= warm_up
+        n_logged = int(logged.sum())
+        first = log.extend(n_logged, 
+                           caller=np.flatnonzero(logged) + 1,
+                           arrival_time=arrival_times[logged])
+        rows = np.full(len(arrival_times), -1)
+        rows[logged] = first + np.arange(n_logged)
+
+        collect = answered & logged
+        log.record(rows[collect], 'operator_wait', 
+                   call_starts[collect] - arrival_times[collect])
+        collect = logged[end_order]
+        log.record(rows[end_order[collect]], 'call_duration', 
+                   call_durations[end_order[collect]])
+        log.record(rows[end_order[collect]], 'callback', callback[collect])
+        collect = nurse_answered & logged[nurse_callers]
+        log.record(rows[nurse_callers[collect]], 'nurse_wait', 
+                   nurse_starts[collect] - nurse_arrivals[collect])
+        collect = nurse_completed & logged[nurse_callers]
+        log.record(rows[nurse_callers[collect]], 'nurse_call_duration',
+                   nurse_durations[collect])
 
 #  MODEL WRAPPER FUNCTIONS ##################################################
 
-def single_run(experiment, rc_period=RESULTS_COLLECTION_PERIOD):
+def single_run(experiment, rc_period=RESULTS_COLLECTION_PERIOD, rep=None,
+               engine='simpy', warm_up=WARM_UP, instrumentation=None,
+               tracer=None):
     '''
     Perform a single run of the model and return the results
     
     Parameters:
     -----------
     
-    experiment: Experiment
-        The experiment/paramaters to use with model
+    experiment: Experiment or ExperimentSpec
+        The experiment/paramaters to use with model.  An Experiment is
+        used as the run context: its distributions, resources and results
+        are updated by the run.  A spec is not modified and each run
+        creates its own context, so a spec can be run from several
+        threads at once.
 
     rc_period: float, optional (default=RESULTS_COLLECTION_PERIOD)
         Model run length.
+
+    rep: int, optional (default=None)
+        Replication number (zero indexed). Selects the random number
+        streams used by the run. If None the experiment's current
+        distributions (or a spec's fixed seeds) are used.
+
+    engine: str, optional (default='simpy')
+        'simpy' runs the simpy model. 'fast' runs `fast_model`.
+
+    warm_up: float, optional (default=WARM_UP)
+        Length of the warm-up period.  The model runs for warm_up + 
+        rc_period and results are only collected after the warm-up.
+
+    instrumentation: profiling.Instrumentation, optional (default=None)
+        If provided, counts and times event scheduling, sampling, resource
+        requests/releases and results recording during the run.
+
+    tracer: tracing.Tracer, optional (default=None)
+        Receives structured events (arrivals, calls answered etc) from the
+        simpy engine.  If None and the module level TRACE is True events
+        are printed.  Not used by the 'fast' engine.
     '''
+    if engine not in ('simpy', 'fast'):
+        raise ValueError(f'Unknown engine {engine}. Use simpy or fast.')
+
+    # use the random number streams of the replication
+    if isinstance(experiment, ExperimentSpec):
+        experiment = experiment.create_context(rep)
+    elif rep is not None:
+        experiment.set_replication(rep)
+
     # results dictionary.  Each KPI is a new entry.
     run_results = {}
     
     # reset all results variables to zero and empty
     experiment.init_results_variables()
-    
-    # environment is (re)created inside single run
-    env = simpy.Environment()
 
-    # we create simpy resources here - this has to be after we
-    # create the simpy environment object.
-    experiment.operators = simpy.Resource(env, capacity=experiment.n_operators)
-    experiment.nurses = simpy.Resource(env, capacity=experiment.n_nurses)
-    
-    # we pass the experiment to the arrivals generator
-    env.process(arrivals_generator(env, experiment))
-    env.run(until=rc_period)
+    # timed versions of the environment, resources, distributions and
+    # collectors are only used when the run is instrumented
+    resource_class = MonitoredResource if experiment.monitor_resources \
+        else simpy.Resource
+    if instrumentation is None:
+        instrumented = nullcontext()
+        create_environment = simpy.Environment
+        create_resource = resource_class
+    else:
+        instrumented = instrumentation.instrument(experiment)
+        create_environment = instrumentation.create_environment
+        create_resource = lambda env, capacity: \
+            instrumentation.create_resource(env, capacity, resource_class)
+
+    with instrumented:
+        if engine == 'fast':
+            fast_model(experiment, rc_period, warm_up)
+        else:
+            # environment is (re)created inside single run
+            env = create_environment()
+
+            # we create simpy resources here - this has to be after we
+            # create the simpy environment object.
+            experiment.operators = create_resource(env, 
+                                                   experiment.n_operators)
+            experiment.nurses = create_resource(env, experiment.n_nurses)
+            
+            # we pass the experiment to the arrivals generator
+            if tracer is None and TRACE:
+                tracer = Tracer(PrintSink())
+            env.process(arrivals_generator(env, experiment, tracer))
+            if warm_up > 0.0:
+                env.process(warm_up_complete(env, warm_up, experiment,
+                                             tracer))
+            env.run(until=warm_up + rc_period)
+
+            if experiment.monitor_resources:
+                experiment.results['operator_statistics'] = \
+                    experiment.operators.statistics()
+                experiment.results['nurse_statistics'] = \
+                    experiment.nurses.statistics()
 
     # end of run results: calculate mean waiting time
     run_results['01_mean_waiting_time'] = \
-        np.mean(experiment.results['waiting_times'])
+        experiment.results['waiting_times'].mean
     
     # end of run results: calculate mean operator utilisation
     run_results['02_operator_util'] = \
@@ -435,82 +1194,529 @@ def single_run(experiment, rc_period=RESULTS_COLLECTION_PERIOD):
     
     # end of run results: nurse waiting time
     run_results['03_mean_nurse_waiting_time'] = \
-        np.mean(experiment.results['nurse_waiting_times'])
+        experiment.results['nurse_waiting_times'].mean
     
     # end of run results: calculate mean nurse utilisation
     run_results['04_nurse_util'] = \
         (experiment.results['total_nurse_call_duration'] \
          / (rc_period * experiment.n_nurses)) * 100.0
+
+    # optional time-weighted queue length and utilisation
+    if experiment.monitor_resources:
+        operators = experiment.results['operator_statistics']
+        run_results['05_mean_operator_queue'] = operators['mean_queue']
+        run_results['06_peak_operator_queue'] = operators['peak_queue']
+        run_results['07_operator_util_time_weighted'] = \
+            operators['utilisation']
+
+        nurses = experiment.results['nurse_statistics']
+        run_results['08_mean_nurse_queue'] = nurses['mean_queue']
+        run_results['09_peak_nurse_queue'] = nurses['peak_queue']
+        run_results['10_nurse_util_time_weighted'] = nurses['utilisation']
     
     # return the results from the run of the model
     return run_results
 
+def _replication_worker(experiment, rc_period, rep, engine, warm_up):
+    '''
+    Run a single replication in a worker process or thread.  The
+    replication runs in its own context created from the experiment spec.
+    '''
+    return single_run(experiment, rc_period, rep, engine, warm_up)
+
+
+def create_executor(n_jobs=N_JOBS):
+    '''
+    Create a pool of worker processes to run replications.  Used by every
+    module that runs replications in parallel.
+
+    Params:
+    ------
+    n_jobs: int, optional (default=N_JOBS)
+        Number of worker processes.  -1 uses all available cores.
+
+    Returns:
+    -------
+    concurrent.futures.ProcessPoolExecutor
+    '''
+    if n_jobs == 0 or n_jobs < -1:
+        raise ValueError(f'n_jobs must be -1 or a positive int: {n_jobs}')
+    max_workers = None if n_jobs == -1 else n_jobs
+    return ProcessPoolExecutor(max_workers=max_workers)
+
+
+def iter_replications(experiment, rc_period=RESULTS_COLLECTION_PERIOD,
+                      n_reps=5, n_jobs=N_JOBS, executor=None,
+                      engine='simpy', start_rep=0, warm_up=WARM_UP):
+    '''
+    Run multiple replications of the model and yield the results of each
+    replication as it completes.  When replications are run in parallel
+    they are yielded in completion order.
+
+    Closing the generator early (e.g. when a user cancels) cancels any
+    replications that have not started.
+
+    Params:
+    ------
+    experiment: Experiment or ExperimentSpec
+        The experiment/paramaters to use with model.  Each replication
+        runs in its own context so the experiment is not modified.
+
+    rc_period: float, optional (default=DEFAULT_RESULTS_COLLECTION_PERIOD)
+        results collection period.
+        the number of minutes to run the model to collect results
+
+    n_reps: int, optional (default=5)
+        Number of independent replications to run.
+
+    n_jobs: int, optional (default=N_JOBS)
+        Number of worker processes to use.  1 runs the replications in
+        serial.  -1 uses all available cores.
+
+    executor: concurrent.futures.Executor, optional (default=None)
+        An existing executor (process or thread pool) to run the
+        replications.  If provided `n_jobs` is ignored.
+
+    engine: str, optional (default='simpy')
+        The model engine used by `single_run`: 'simpy' or 'fast'.
+
+    start_rep: int, optional (default=0)
+        The (zero indexed) replication number of the first replication.
+
+    warm_up: float, optional (default=WARM_UP)
+        Length of the warm-up period of each replication.
+
+    Yields:
+    -------
+    tuple (int, dict)
+        The replication label (one indexed, as used in the results 
+        DataFrame) and the replication's KPIs.
+    '''
+    reps = range(start_rep, start_rep + n_reps)
+    spec = experiment_spec(experiment)
+
+    if executor is None and n_jobs == 1:
+        for rep in reps:
+            yield rep + 1, single_run(spec, rc_period, rep, engine, warm_up)
+        return
+
+    own_executor = executor is None
+    if own_executor:
+        executor = create_executor(n_jobs)
+
+    futures = {executor.submit(_replication_worker, spec, rc_period,
+                               rep, engine, warm_up): rep for rep in reps}
+    try:
+        for future in as_completed(futures):
+            yield futures[future] + 1, future.result()
+    finally:
+        for future in futures:
+            future.cancel()
+        if own_executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+def replications_frame(results):
+    '''
+    Format the results of replications as a DataFrame.
+
+    Params:
+    ------
+    results: dict
+        Results of each replication keyed by replication label (one 
+        indexed).
+
+    Returns:
+    --------
+    pandas.DataFrame
+    '''
+    reps = sorted(results)
+    df_results = pd.DataFrame([results[rep] for rep in reps], 
+                              index=pd.Index(reps, name='rep'))
+    return df_results
+
 def multiple_replications(experiment, 
                           rc_period=RESULTS_COLLECTION_PERIOD,
-                          n_reps=5):
+                          n_reps=5, n_jobs=N_JOBS, executor=None,
+                          engine='simpy', start_rep=0, warm_up=WARM_UP):
     '''
     Perform multiple replications of the model.
+
+    Each replication uses its own random number streams from the 
+    experiment so results are identical regardless of the number of 
+    worker processes.
     
     Params:
     ------
-    experiment: Experiment
-        The experiment/paramaters to use with model
-    
+    experiment: Experiment or ExperimentSpec
+        The experiment/paramaters to use with model.  Each replication
+        runs in its own context so the experiment is not modified.
+
     rc_period: float, optional (default=DEFAULT_RESULTS_COLLECTION_PERIOD)
-        results collection period.  
+        results collection period.
         the number of minutes to run the model to collect results
 
     n_reps: int, optional (default=5)
         Number of independent replications to run.
+
+    n_jobs: int, optional (default=N_JOBS)
+        Number of worker processes to use.  1 runs the replications in
+        serial.  -1 uses all available cores.
+
+    executor: concurrent.futures.Executor, optional (default=None)
+        An existing executor (process or thread pool) to run the
+        replications.  If provided `n_jobs` is ignored.
+
+    engine: str, optional (default='simpy')
+        The model engine used by `single_run`: 'simpy' or 'fast'.
+
+    start_rep: int, optional (default=0)
+        The (zero indexed) replication number of the first replication.
+        Used to extend an existing set of replications.
+
+    warm_up: float, optional (default=WARM_UP)
+        Length of the warm-up period of each replication.
         
     Returns:
     --------
     pandas.DataFrame
     '''
-
-    # loop over single run to generate results dicts in a python list.
-    results = [single_run(experiment, rc_period) for rep in range(n_reps)]
+    results = dict(iter_replications(experiment, rc_period, n_reps, n_jobs,
+                                     executor, engine, start_rep, warm_up))
         
     # format and return results in a dataframe
-    df_results = pd.DataFrame(results)
-    df_results.index = np.arange(1, len(df_results)+1)
-    df_results.index.name = 'rep'
-    return df_results
+    return replications_frame(results)
+
+def replications_until_precision(experiment, 
+                                 target_half_width=TARGET_HALF_WIDTH,
+                                 kpis=None,
+                                 rc_period=RESULTS_COLLECTION_PERIOD,
+                                 alpha=ALPHA, min_reps=MIN_REPS, 
+                                 max_reps=MAX_REPS, batch_size=BATCH_SIZE,
+                                 n_jobs=N_JOBS, executor=None, 
+                                 engine='simpy', warm_up=WARM_UP):
+    '''
+    Run replications of the model in batches until the relative half width
+    of the confidence interval of every selected KPI is below a target.
+
+    The mean and variance of each KPI are updated as each replication 
+    completes using Welford's algorithm.
+
+    Params:
+    ------
+    experiment: Experiment
+        The experiment/paramaters to use with model
+
+    target_half_width: float, optional (default=TARGET_HALF_WIDTH)
+        Target confidence interval half width as a proportion of the mean
+        e.g. 0.05 = 5%.
+
+    kpis: list, optional (default=None)
+        Names of the KPIs to check.  None checks all KPIs.
+
+    rc_period: float, optional (default=DEFAULT_RESULTS_COLLECTION_PERIOD)
+        results collection period.
+
+    alpha: float, optional (default=ALPHA)
+        Significance level of the confidence intervals.
+
+    min_reps: int, optional (default=MIN_REPS)
+        Minimum number of replications to run.
+
+    max_reps: int, optional (default=MAX_REPS)
+        Stop after this number of replications even if the target has not
+        been met.
+
+    batch_size: int, optional (default=BATCH_SIZE)
+        Number of replications run between checks of the precision.
+
+    n_jobs: int, optional (default=N_JOBS)
+        Number of worker processes to use.  1 runs the replications in
+        serial.  -1 uses all available cores.
+
+    executor: concurrent.futures.Executor, optional (default=None)
+        An existing executor to run the replications.  If provided 
+        `n_jobs` is ignored.
+
+    engine: str, optional (default='simpy')
+        The model engine used by `single_run`: 'simpy' or 'fast'.
+
+    warm_up: float, optional (default=WARM_UP)
+        Length of the warm-up period of each replication.
+
+    Nan KPI values (e.g. the mean waiting time of a run where nobody 
+    waited) are excluded from the KPI's statistics.  A KPI without a
+    confidence interval (e.g. all values nan) is ignored by the stopping
+    rule and reported with `target_met` False.
+
+    Returns:
+    --------
+    tuple (pandas.DataFrame, pandas.DataFrame)
+        The results of each replication and, for each KPI, the mean, 
+        confidence interval, relative half width achieved, number of
+        (non nan) observations and if the target was met.
+    '''
+    results = {}
+    stats = {}
+
+    # a single pool of worker processes is shared by all batches
+    own_executor = executor is None and n_jobs != 1
+    if own_executor:
+        executor = create_executor(n_jobs)
+
+    try:
+        while len(results) < max_reps:
+            n_batch = max(batch_size, min_reps - len(results))
+            n_batch = min(n_batch, max_reps - len(results))
+
+            for rep, rep_results in iter_replications(experiment, rc_period,
+                                                      n_batch, n_jobs,
+                                                      executor, engine,
+                                                      len(results), warm_up):
+                results[rep] = rep_results
+                for kpi, value in rep_results.items():
+                    kpi_stats = stats.setdefault(kpi, OnlineStatistics())
+                    # e.g. a mean waiting time is nan if nobody waited
+                    if not np.isnan(value):
+                        kpi_stats.update(value)
+
+            # KPIs without a confidence interval (nan) do not stop the run
+            selected = stats.keys() if kpis is None else kpis
+            widths = [stats[kpi].relative_half_width(alpha)
+                      for kpi in selected]
+            if all(width < target_half_width for width in widths
+                   if not np.isnan(width)):
+                break
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+    # format results in dataframes
+    df_results = replications_frame(results)
+
+    precision = {}
+    for kpi, kpi_stats in stats.items():
+        half_width = kpi_stats.half_width(alpha)
+        relative_half_width = kpi_stats.relative_half_width(alpha)
+        precision[kpi] = {'mean': kpi_stats.mean,
+                          'lower_ci': kpi_stats.mean - half_width,
+                          'upper_ci': kpi_stats.mean + half_width,
+                          'relative_half_width': relative_half_width,
+                          'n': kpi_stats.n,
+                          'target_met': 
+                              bool(relative_half_width < target_half_width)}
+    df_precision = pd.DataFrame(precision).T
+    df_precision.index.name = 'kpi'
+    return df_results, df_precision
 
 # Support for running batch experiments
 
+def select_warm_up(experiment, pilot_period=PILOT_PERIOD, n_reps=PILOT_REPS,
+                   engine='fast', start_rep=0, interval=PILOT_INTERVAL):
+    '''
+    Select a warm-up period using MSER-5 on the operator waiting times 
+    from pilot runs of the model.
+
+    A single pilot run gives a very noisy truncation point, so `n_reps` 
+    pilot replications are run.  The mean operator waiting time of calls
+    answered in each `interval` of each replication is averaged across
+    the replications (Welch's method) and MSER-5 is applied to the
+    averaged series.
+
+    Params:
+    ------
+    experiment: Experiment or ExperimentSpec
+        The experiment/paramaters to use with model.  The experiment is
+        not modified.
+
+    pilot_period: float, optional (default=PILOT_PERIOD)
+        Length of each pilot run.  Should be much longer than the expected
+        warm-up period.
+
+    n_reps: int, optional (default=PILOT_REPS)
+        Number of pilot replications.
+
+    engine: str, optional (default='fast')
+        The model engine used by the pilot runs.
+
+    start_rep: int, optional (default=0)
+        Replication number of the first pilot run.
+
+    interval: float, optional (default=PILOT_INTERVAL)
+        Length of the time intervals waiting times are averaged over.
+
+    Returns:
+    -------
+    float
+        The warm-up period: the start of the first interval after the
+        truncation point.
+    '''
+    spec = replace(experiment_spec(experiment), log_callers=True)
+    n_intervals = int(np.ceil(pilot_period / interval))
+    totals = np.zeros(n_intervals)
+    counts = np.zeros(n_intervals)
+
+    for rep in range(start_rep, start_rep + n_reps):
+        pilot = spec.create_context(rep)
+        single_run(pilot, pilot_period, engine=engine)
+
+        # operator waiting times by the interval calls were answered in
+        log = pilot.results['event_log'].to_frame()
+        log = log.dropna(subset=['operator_wait'])
+        answered = log['arrival_time'] + log['operator_wait']
+        index = np.minimum((answered // interval).astype(int), 
+                           n_intervals - 1)
+        totals += np.bincount(index, weights=log['operator_wait'], 
+                              minlength=n_intervals)
+        counts += np.bincount(index, minlength=n_intervals)
+
+    # mean waiting time in each interval across the replications.  No
+    # calls were answered in an empty interval so nobody waited.
+    means = np.divide(totals, counts, out=np.zeros(n_intervals), 
+                      where=counts > 0)
+
+    truncation = mser5(means)
+    return float(truncation * interval)
+
+def offered_load(experiment):
+    '''
+    The highest offered load (utilisation if queues were stable) of the 
+    operators and nurses in an experiment.  Used to estimate the relative
+    run time of experiments: busier systems run more events.
+
+    Params:
+    ------
+    experiment: Experiment
+        The experiment/paramaters to use with model
+
+    Returns:
+    -------
+    float
+    '''
+    mean_call = (experiment.call_low + experiment.call_mode 
+                 + experiment.call_high) / 3
+    mean_nurse_call = (experiment.nurse_call_low 
+                       + experiment.nurse_call_high) / 2
+    operator_load = mean_call / (experiment.mean_iat * experiment.n_operators)
+    nurse_load = (experiment.chance_callback * mean_nurse_call 
+                  / (experiment.mean_iat * experiment.n_nurses))
+    return max(operator_load, nurse_load)
+
 def run_all_experiments(experiments, rc_period=RESULTS_COLLECTION_PERIOD,
-                        n_reps=5):
+                        n_reps=5, n_jobs=N_JOBS, executor=None, 
+                        engine='simpy', common_random_numbers=False,
+                        random_number_set=None, warm_up=WARM_UP):
     '''
     Run each of the scenarios for a specified results
     collection period and replications.
+
+    With common random numbers replication k of every scenario uses the 
+    same arrival, call, callback and nurse random number streams.  This 
+    reduces the variance of the differences between scenarios (see 
+    `paired_difference_frame`).
+
+    In parallel every (scenario, replication) pair is submitted to a single
+    pool of workers. Replications of the busiest scenarios are submitted 
+    first and workers take the next task as they finish to balance the 
+    load.
     
     Params:
     ------
     experiments: dict
-        dictionary of Experiment objects
+        dictionary of Experiment or ExperimentSpec objects
         
     rc_period: float
         model run length
-    
+
+    n_reps: int, optional (default=5)
+        Number of independent replications to run.
+
+    n_jobs: int, optional (default=N_JOBS)
+        Number of worker processes to use.  1 runs the experiments in
+        serial.  -1 uses all available cores.
+
+    executor: concurrent.futures.Executor, optional (default=None)
+        An existing executor to run the replications.  If provided 
+        `n_jobs` is ignored.
+
+    engine: str, optional (default='simpy')
+        The model engine used by `single_run`: 'simpy' or 'fast'.
+
+    common_random_numbers: bool, optional (default=False)
+        Use the same random number streams in all scenarios.
+
+    random_number_set: int, optional (default=None)
+        Root seed of the common random number streams.  Only used with
+        common random numbers. None creates unique streams.
+
+    warm_up: float, optional (default=WARM_UP)
+        Length of the warm-up period of each replication.
+
+    Returns:
+    --------
+    dict
+        pandas.DataFrame of replications for each experiment.
     '''
     print('Model experiments:')
     print(f'No. experiments to execute = {len(experiments)}\n')
 
-    experiment_results = {}
-    for exp_name, experiment in experiments.items():
-        
-        print(f'Running {exp_name}', end=' => ')
-        results = multiple_replications(experiment, rc_period, n_reps)
-        print('done.\n')
+    experiments = {exp_name: experiment_spec(experiment)
+                   for exp_name, experiment in experiments.items()}
+
+    if common_random_numbers:
+        # specs that share the same random number streams
+        if random_number_set is None:
+            random_number_set = np.random.SeedSequence().entropy
+        experiments = {exp_name: replace(spec,
+                                         random_number_set=random_number_set)
+                       for exp_name, spec in experiments.items()}
+
+    if executor is None and n_jobs == 1:
+        experiment_results = {}
+        for exp_name, experiment in experiments.items():
+            
+            print(f'Running {exp_name}', end=' => ')
+            results = multiple_replications(experiment, rc_period, n_reps,
+                                            engine=engine, warm_up=warm_up)
+            print('done.\n')
+            
+            #save the results
+            experiment_results[exp_name] = results
         
-        #save the results
-        experiment_results[exp_name] = results
+        print('All experiments are complete.')
+        return experiment_results
+
+    own_executor = executor is None
+    if own_executor:
+        executor = create_executor(n_jobs)
+
+    # busiest experiments first
+    exp_names = sorted(experiments, reverse=True,
+                       key=lambda name: offered_load(experiments[name]))
     
+    try:
+        futures = {}
+        for exp_name in exp_names:
+            for rep in range(n_reps):
+                future = executor.submit(_replication_worker, 
+                                         experiments[exp_name], rc_period,
+                                         rep, engine, warm_up)
+                futures[future] = (exp_name, rep)
+
+        results = {exp_name: {} for exp_name in experiments}
+        for future in as_completed(futures):
+            exp_name, rep = futures[future]
+            results[exp_name][rep + 1] = future.result()
+            if len(results[exp_name]) == n_reps:
+                print(f'{exp_name} => done.')
+    finally:
+        if own_executor:
+            executor.shutdown(cancel_futures=True)
+
     print('All experiments are complete.')
-    
-    # format thje results
-    return experiment_results
+
+    # format the results
+    return {exp_name: replications_frame(exp_results) 
+            for exp_name, exp_results in results.items()}
 
 def experiment_summary_frame(experiment_results):
     '''
@@ -534,4 +1740,45 @@ def experiment_summary_frame(experiment_results):
 
     summary.columns = columns
     return summary
-                    
\ No newline at end of file
+
+def paired_difference_frame(experiment_results, baseline, alpha=ALPHA):
+    '''
+    Mean difference of each performance measure between each experiment 
+    and a baseline experiment with a confidence interval.  Differences are 
+    paired by replication so the experiments should be run with common 
+    random numbers and the same number of replications.
+
+    Parameters:
+    ----------
+    experiment_results: dict
+        dictionary of replications.  
+        Key identifies the experiment
+
+    baseline: str
+        Name of the baseline experiment
+
+    alpha: float, optional (default=ALPHA)
+        Significance level of the confidence intervals.
+
+    Returns:
+    -------
+    pd.DataFrame
+    '''
+    base = experiment_results[baseline]
+    rows = {}
+    for sc_name, replications in experiment_results.items():
+        if sc_name == baseline:
+            continue
+        differences = replications - base
+        n = len(differences)
+        mean = differences.mean()
+        half_width = (t.ppf(1 - alpha / 2, n - 1) * differences.std() 
+                      / np.sqrt(n))
+        for kpi in differences.columns:
+            rows[(sc_name, kpi)] = {'mean_difference': mean[kpi],
+                                    'lower_ci': mean[kpi] - half_width[kpi],
+                                    'upper_ci': mean[kpi] + half_width[kpi]}
+                                    
+    summary = pd.DataFrame.from_dict(rows, orient='index')
+    summary.index.names = ['experiment', 'kpi']
+    return summary
@@ -0,0 +1,396 @@
+'''
+Output analysis tools for the 111 call centre model.
+
+Statistics are updated one observation at a time so that they can be 
+used while a model or experiment is running.
+'''
+import numpy as np
+from scipy.stats import t
+
+# default significance level for confidence intervals
+ALPHA = 0.05
+
+
+class P2Quantile():
+    '''
+    Streaming estimate of a quantile using the P-squared algorithm 
+    (Jain and Chlamtac, 1985).  Uses five markers so memory is constant.
+    '''
+    def __init__(self, p):
+        '''
+        Constructor
+
+        Params:
+        ------
+        p: float
+            The quantile to estimate e.g. 0.9
+        '''
+        self.p = p
+        self.n = 0
+        # marker heights, positions, desired positions and increments
+        self._heights = []
+        self._positions = [1, 2, 3, 4, 5]
+        self._desired = [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]
+        self._increments = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def update(self, x):
+        '''
+        Update the estimate with a new observation.
+
+        Params:
+        ------
+        x: float
+            The observation
+        '''
+        self.n += 1
+        heights = self._heights
+        if self.n <= 5:
+            heights.append(x)
+            heights.sort()
+            return
+
+        positions = self._positions
+
+        # find the cell containing x and update the extreme markers
+        if x < heights[0]:
+            heights[0] = x
+            k = 0
+        elif x >= heights[4]:
+            heights[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= heights[k + 1]:
+                k += 1
+
+        for i in range(k + 1, 5):
+            positions[i] += 1
+        for i in range(5):
+            self._desired[i] += self._increments[i]
+
+        # adjust the heights of the middle markers if necessary
+        for i in range(1, 4):
+            d = self._desired[i] - positions[i]
+            if (d >= 1 and positions[i + 1] - positions[i] > 1) or \
+                (d <= -1 and positions[i - 1] - positions[i] < -1):
+                d = 1 if d > 0 else -1
+                height = self._parabolic(i, d)
+                if not heights[i - 1] < height < heights[i + 1]:
+                    height = self._linear(i, d)
+                heights[i] = height
+                positions[i] += d
+
+    def _parabolic(self, i, d):
+        '''
+        Piecewise parabolic prediction of a marker height
+        '''
+        q = self._heights
+        n = self._positions
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+
+    def _linear(self, i, d):
+        '''
+        Linear prediction of a marker height
+        '''
+        q = self._heights
+        n = self._positions
+        return q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+
+    @property
+    def value(self):
+        '''
+        The current estimate of the quantile (nan if no observations)
+        '''
+        if self.n == 0:
+            return np.nan
+        if self.n <= 5:
+            return float(np.quantile(self._heights, self.p))
+        return self._heights[2]
+
+
+class OnlineStatistics():
+    '''
+    Running count, mean, variance, minimum and maximum of a stream of
+    observations.  The mean and variance are calculated using Welford's 
+    algorithm. Quantiles are (optionally) estimated using `P2Quantile`.
+    
+    Memory use is constant regardless of the number of observations.
+    '''
+    def __init__(self, quantiles=()):
+        '''
+        Constructor
+
+        Params:
+        ------
+        quantiles: sequence of float, optional (default=())
+            Quantiles to estimate e.g. (0.5, 0.9)
+        '''
+        self.n = 0
+        self._mean = 0.0
+        self._sq = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self._quantiles = {p: P2Quantile(p) for p in quantiles}
+
+    def update(self, x):
+        '''
+        Update the statistics with a new observation.
+
+        Params:
+        ------
+        x: float
+            The observation
+        '''
+        self.n += 1
+        delta = x - self._mean
+        self._mean += delta / self.n
+        self._sq += delta * (x - self._mean)
+        if x < self.min:
+            self.min = x
+        if x > self.max:
+            self.max = x
+        for estimator in self._quantiles.values():
+            estimator.update(x)
+
+    def extend(self, values):
+        '''
+        Update the statistics with an array of observations.  The mean and 
+        variance of the array are combined with the current statistics 
+        (Chan et al. 1979).
+
+        Params:
+        ------
+        values: array-like
+            The observations
+        '''
+        values = np.asarray(values, dtype=float)
+        n_new = len(values)
+        if n_new == 0:
+            return
+        mean_new = values.mean()
+        n_total = self.n + n_new
+        delta = mean_new - self._mean
+        self._sq += (((values - mean_new) ** 2).sum() 
+                     + delta ** 2 * self.n * n_new / n_total)
+        self._mean += delta * n_new / n_total
+        self.n = n_total
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        for estimator in self._quantiles.values():
+            for x in values.tolist():
+                estimator.update(x)
+
+    def merge(self, other):
+        '''
+        Combine the statistics of another stream of observations e.g. 
+        statistics collected by parallel workers (Chan et al. 1979).  
+        P-squared quantile estimates cannot be combined, so neither set of
+        statistics may estimate quantiles.
+
+        Params:
+        ------
+        other: OnlineStatistics
+            Statistics of the other observations
+        '''
+        if self._quantiles or other._quantiles:
+            raise ValueError('Statistics with quantiles cannot be merged.')
+        if other.n == 0:
+            return
+        n_total = self.n + other.n
+        delta = other._mean - self._mean
+        self._sq += other._sq + delta ** 2 * self.n * other.n / n_total
+        self._mean += delta * other.n / n_total
+        self.n = n_total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @property
+    def mean(self):
+        '''
+        Mean of the observations (nan if no observations)
+        '''
+        if self.n == 0:
+            return np.nan
+        return self._mean
+
+    @property
+    def variance(self):
+        '''
+        Sample variance (nan if less than two observations)
+        '''
+        if self.n < 2:
+            return np.nan
+        return self._sq / (self.n - 1)
+
+    @property
+    def std(self):
+        '''
+        Sample standard deviation (nan if less than two observations)
+        '''
+        return np.sqrt(self.variance)
+
+    def half_width(self, alpha=ALPHA):
+        '''
+        Half width of the 100(1 - alpha)% confidence interval of the mean.
+
+        Params:
+        ------
+        alpha: float, optional (default=ALPHA)
+            Significance level.
+
+        Returns:
+        -------
+        float
+        '''
+        if self.n < 2:
+            return np.nan
+        return t.ppf(1 - alpha / 2, self.n - 1) * self.std / np.sqrt(self.n)
+
+    def relative_half_width(self, alpha=ALPHA):
+        '''
+        Half width of the confidence interval as a proportion of the mean.
+        If the mean and half width are both zero then 0.0 is returned.
+
+        Params:
+        ------
+        alpha: float, optional (default=ALPHA)
+            Significance level.
+
+        Returns:
+        -------
+        float
+        '''
+        half_width = self.half_width(alpha)
+        if self.mean == 0.0:
+            return 0.0 if half_width == 0.0 else np.inf
+        return half_width / abs(self.mean)
+
+    def quantile(self, p):
+        '''
+        Estimated quantile.  The quantile must be passed to the constructor.
+
+        Params:
+        ------
+        p: float
+            The quantile e.g. 0.9
+
+        Returns:
+        -------
+        float
+        '''
+        return self._quantiles[p].value
+
+
+class SampleStatistics(OnlineStatistics):
+    '''
+    Statistics of a stream of observations that also stores every 
+    observation in `samples`.  Use when the raw samples are needed.
+    '''
+    def __init__(self, quantiles=()):
+        '''
+        Constructor
+
+        Params:
+        ------
+        quantiles: sequence of float, optional (default=())
+            Quantiles that are available from `quantile()`.  Calculated 
+            exactly from the samples.
+        '''
+        super().__init__()
+        self.samples = []
+
+    def update(self, x):
+        '''
+        Store a new observation and update the statistics.
+
+        Params:
+        ------
+        x: float
+            The observation
+        '''
+        self.samples.append(x)
+        super().update(x)
+
+    def extend(self, values):
+        '''
+        Store an array of observations and update the statistics.
+
+        Params:
+        ------
+        values: array-like
+            The observations
+        '''
+        values = np.asarray(values, dtype=float)
+        self.samples.extend(values.tolist())
+        super().extend(values)
+
+    def merge(self, other):
+        '''
+        Combine the samples and statistics of another stream of 
+        observations.
+
+        Params:
+        ------
+        other: SampleStatistics
+            Statistics (and samples) of the other observations
+        '''
+        self.samples.extend(other.samples)
+        super().merge(other)
+
+    def quantile(self, p):
+        '''
+        Quantile of the samples (nan if no observations).
+
+        Params:
+        ------
+        p: float
+            The quantile e.g. 0.9
+
+        Returns:
+        -------
+        float
+        '''
+        if self.n == 0:
+            return np.nan
+        return float(np.quantile(self.samples, p))
+
+
+def mser5(data, batch_size=5):
+    '''
+    Select the truncation point of a time series of observations using 
+    MSER-5 (White et al. 2000).  The data are grouped into batch means and
+    the number of batches deleted minimises the marginal standard error of
+    the remaining batch means.  Only the first half of the batches are
+    considered as truncation points.
+
+    Params:
+    ------
+    data: array-like
+        Observations in time order e.g. waiting times from a pilot run.
+
+    batch_size: int, optional (default=5)
+        Number of observations in each batch.
+
+    Returns:
+    -------
+    int
+        The number of observations to delete.
+    '''
+    data = np.asarray(data, dtype=float)
+    n_batches = len(data) // batch_size
+    if n_batches < 2:
+        return 0
+    batch_means = data[:n_batches * batch_size].reshape(n_batches, 
+                                                        batch_size).mean(axis=1)
+
+    # sum and sum of squares of the batch means remaining after deleting d
+    remaining = np.arange(n_batches, 0, -1)
+    sums = np.cumsum(batch_means[::-1])[::-1]
+    sum_squares = np.cumsum(batch_means[::-1] ** 2)[::-1]
+    variation = sum_squares - sums ** 2 / remaining
+    mser = variation / remaining ** 2
+
+    truncation = int(np.argmin(mser[:n_batches // 2 + 1]))
+    return truncation * batch_size
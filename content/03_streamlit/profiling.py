@@ -0,0 +1,342 @@
+'''
+Opt-in profiling of the 111 call centre model.
+
+`Instrumentation` records the number of calls and cumulative time spent
+in event scheduling, distribution sampling, resource request/release and
+results recording during a run.  It works by swapping the model's
+environment, resources, distributions and results collectors for timed
+versions at the start of a run, so an uninstrumented run executes exactly
+the same code as before (no per event checks).  The 'fast' engine has no
+events or resources so only sampling and results are timed.
+
+`profile_run` produces a cProfile or pyinstrument report of a run, or a
+collapsed stack dump that can be used to draw a flamegraph (e.g. with
+flamegraph.pl or speedscope).
+
+Usage:
+
+    instrumentation = Instrumentation()
+    single_run(experiment, instrumentation=instrumentation)
+    print(instrumentation.summary())
+'''
+import cProfile
+import io
+import pstats
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+import pandas as pd
+import simpy
+
+# instrumented categories
+SCHEDULING = 'event_scheduling'
+SAMPLING = 'sampling'
+RESOURCES = 'resource_request_release'
+RESULTS = 'results_recording'
+
+# formats available from profile_run
+PROFILE_FORMATS = ('cprofile', 'pyinstrument', 'collapsed')
+
+
+class Instrumentation():
+    '''
+    Counts and cumulative time of the main activities in a run of the
+    model.  Pass to `model.single_run(instrumentation=...)`.
+    '''
+    def __init__(self):
+        '''
+        Constructor
+        '''
+        self.counts = defaultdict(int)
+        self.times = defaultdict(float)
+
+    def add(self, category, elapsed):
+        '''
+        Record a timed call.
+
+        Params:
+        ------
+        category: str
+            The activity e.g. SAMPLING
+
+        elapsed: float
+            Time taken by the call (seconds)
+        '''
+        self.counts[category] += 1
+        self.times[category] += elapsed
+
+    def create_environment(self):
+        '''
+        Create a simpy environment that times event scheduling.
+
+        Returns:
+        -------
+        InstrumentedEnvironment
+        '''
+        return InstrumentedEnvironment(self)
+
+    def create_resource(self, env, capacity, resource_class=simpy.Resource):
+        '''
+        Create a simpy resource that times requests and releases.
+
+        Params:
+        ------
+        env: simpy.Environment
+            The simulation environment
+
+        capacity: int
+            Number of servers
+
+        resource_class: type, optional (default=simpy.Resource)
+            The resource to time e.g. model.MonitoredResource
+
+        Returns:
+        -------
+        TimedResource
+        '''
+        if resource_class is simpy.Resource:
+            return TimedResource(env, capacity, self)
+        timed_class = type(f'Timed{resource_class.__name__}', 
+                           (TimedResource, resource_class), {})
+        return timed_class(env, capacity, self)
+
+    @contextmanager
+    def instrument(self, experiment):
+        '''
+        Context manager that replaces the experiment's distributions and
+        results collectors with timed versions for the duration of a run.
+        The originals are restored afterwards.
+
+        Params:
+        ------
+        experiment: model.Experiment
+            The experiment being run.  Results variables must already
+            have been initialised.
+        '''
+        dist_names = ['arrival_dist', 'call_dist', 'callback_dist',
+                      'nurse_dist']
+        originals = {name: getattr(experiment, name) for name in dist_names}
+        for name in dist_names:
+            setattr(experiment, name,
+                    TimedDistribution(originals[name], self))
+
+        # collectors are created on reset e.g. at the end of a warm-up
+        create_collector = experiment.create_collector
+        experiment.create_collector = \
+            lambda: TimedCollector(create_collector(), self)
+        for name in ['waiting_times', 'nurse_waiting_times']:
+            experiment.results[name] = TimedCollector(experiment.results[name],
+                                                      self)
+        try:
+            yield self
+        finally:
+            for name, dist in originals.items():
+                setattr(experiment, name, dist)
+            del experiment.create_collector
+            for name in ['waiting_times', 'nurse_waiting_times']:
+                experiment.results[name] = experiment.results[name].collector
+
+    def summary(self):
+        '''
+        Summary of the instrumented activities.
+
+        Returns:
+        -------
+        pandas.DataFrame
+            count, total time and mean time (seconds) of each activity.
+        '''
+        summary = pd.DataFrame({'count': pd.Series(self.counts, dtype=int),
+                                'total_time': pd.Series(self.times,
+                                                        dtype=float)})
+        summary['mean_time'] = summary['total_time'] / summary['count']
+        summary.index.name = 'activity'
+        return summary
+
+
+class InstrumentedEnvironment(simpy.Environment):
+    '''
+    Simpy environment that times the scheduling of events.
+    '''
+    def __init__(self, instrumentation, initial_time=0):
+        super().__init__(initial_time)
+        self.instrumentation = instrumentation
+
+    def schedule(self, event, priority=simpy.core.NORMAL, delay=0):
+        start = time.perf_counter()
+        super().schedule(event, priority, delay)
+        self.instrumentation.add(SCHEDULING, time.perf_counter() - start)
+
+
+class TimedResource(simpy.Resource):
+    '''
+    Simpy resource that times requests and releases.
+    '''
+    def __init__(self, env, capacity, instrumentation):
+        super().__init__(env, capacity)
+        self.instrumentation = instrumentation
+
+    def request(self):
+        start = time.perf_counter()
+        request = super().request()
+        self.instrumentation.add(RESOURCES, time.perf_counter() - start)
+        return request
+
+    def release(self, request):
+        start = time.perf_counter()
+        release = super().release(request)
+        self.instrumentation.add(RESOURCES, time.perf_counter() - start)
+        return release
+
+
+class TimedDistribution():
+    '''
+    Wraps a distribution and times calls to sample().
+    '''
+    def __init__(self, dist, instrumentation):
+        self.dist = dist
+        self.instrumentation = instrumentation
+
+    def sample(self, size=None):
+        start = time.perf_counter()
+        samples = self.dist.sample(size)
+        self.instrumentation.add(SAMPLING, time.perf_counter() - start)
+        return samples
+
+
+class TimedCollector():
+    '''
+    Wraps a results collector and times updates.  Other attributes are
+    read from the wrapped collector.
+    '''
+    def __init__(self, collector, instrumentation):
+        self.collector = collector
+        self.instrumentation = instrumentation
+
+    def update(self, x):
+        start = time.perf_counter()
+        self.collector.update(x)
+        self.instrumentation.add(RESULTS, time.perf_counter() - start)
+
+    def extend(self, values):
+        start = time.perf_counter()
+        self.collector.extend(values)
+        self.instrumentation.add(RESULTS, time.perf_counter() - start)
+
+    def __getattr__(self, name):
+        return getattr(self.collector, name)
+
+
+class StackProfiler():
+    '''
+    Deterministic profiler that records the time spent in each unique
+    call stack.  Output is in the collapsed ("folded") stack format used by
+    flamegraph tools: one line per stack with frames separated by ';'
+    followed by the time in microseconds.
+    '''
+    def __init__(self):
+        self.stack_times = defaultdict(float)
+        self._stack = []
+        self._last = None
+
+    def _frame_name(self, frame, arg, event):
+        if event.startswith('c_'):
+            return f'{getattr(arg, "__qualname__", arg)} (builtin)'
+        code = frame.f_code
+        return f'{code.co_name} ({code.co_filename.split("/")[-1]}' \
+               + f':{code.co_firstlineno})'
+
+    def _callback(self, frame, event, arg):
+        now = time.perf_counter()
+        if self._stack:
+            self.stack_times[';'.join(self._stack)] += now - self._last
+        if event in ('call', 'c_call'):
+            self._stack.append(self._frame_name(frame, arg, event))
+        elif self._stack:
+            self._stack.pop()
+        self._last = time.perf_counter()
+
+    def start(self):
+        self._last = time.perf_counter()
+        sys.setprofile(self._callback)
+
+    def stop(self):
+        sys.setprofile(None)
+
+    def collapsed(self):
+        '''
+        Return the profile in collapsed stack format.
+
+        Returns:
+        -------
+        str
+        '''
+        return '\n'.join(f'{stack} {int(elapsed * 1e6)}'
+                         for stack, elapsed in self.stack_times.items()
+                         if elapsed >= 1e-6)
+
+
+def profile_run(run, output='cprofile', path=None):
+    '''
+    Profile a function that runs the model e.g.
+    `lambda: single_run(experiment, rep=0)`.
+
+    Params:
+    ------
+    run: callable
+        Function to profile.  Called with no arguments.
+
+    output: str, optional (default='cprofile')
+        'cprofile' returns a pstats report sorted by cumulative time.
+        'pyinstrument' returns a pyinstrument text report (requires
+        pyinstrument).  'collapsed' returns a collapsed stack dump for
+        flamegraph tools.
+
+    path: str, optional (default=None)
+        If provided the report is also saved to this file.  For 'cprofile'
+        the raw stats are saved (viewable with snakeviz) instead of text.
+
+    Returns:
+    -------
+    str
+    '''
+    if output not in PROFILE_FORMATS:
+        raise ValueError(f'Unknown output {output}. Use one of '
+                         + f'{PROFILE_FORMATS}')
+
+    if output == 'cprofile':
+        profiler = cProfile.Profile()
+        profiler.runcall(run)
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats('cumulative') \
+            .print_stats()
+        report = stream.getvalue()
+        if path is not None:
+            profiler.dump_stats(path)
+        return report
+
+    if output == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            raise ImportError('pyinstrument is required for this output. '
+                              + 'Install with pip install pyinstrument')
+        profiler = Profiler()
+        profiler.start()
+        run()
+        profiler.stop()
+        report = profiler.output_text()
+    else:
+        profiler = StackProfiler()
+        profiler.start()
+        try:
+            run()
+        finally:
+            profiler.stop()
+        report = profiler.collapsed()
+
+    if path is not None:
+        with open(path, 'w') as f:
+            f.write(report)
+    return report
@@ -0,0 +1,285 @@
+'''
+A cache of simulation results shared by the streamlit apps.
+
+Results are keyed on a hash of the experiment parameters, run length and
+warm-up period.
+The per replication results for each key are stored so that a request for
+more replications only runs the missing replications.  The least recently 
+used results are evicted when the cache exceeds a maximum number of 
+entries or memory.
+
+The cache should be created once per app server e.g. using
+`st.cache_resource` so that it is shared across user sessions.
+'''
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+# default maximum number of results stored in the cache
+MAX_ENTRIES = 256
+
+# default maximum memory used by cached results (bytes)
+MAX_BYTES = 256 * 1024 ** 2
+
+# default warm-up period of cached results (as the models)
+WARM_UP = 0.0
+
+
+def experiment_description(experiment, rc_period, warm_up=WARM_UP):
+    '''
+    Describe the results of an experiment: the model, parameters, run 
+    length and warm-up period.
+
+    Params:
+    ------
+    experiment: Experiment or ExperimentSpec
+        A model experiment.  Must have a `parameters()` method.
+
+    rc_period: float
+        Model run length
+
+    warm_up: float, optional (default=WARM_UP)
+        Length of the warm-up period
+
+    Returns:
+    --------
+    dict
+    '''
+    return {'model': type(experiment).__module__,
+            'parameters': experiment.parameters(),
+            'rc_period': rc_period,
+            'warm_up': warm_up}
+
+
+def experiment_key(experiment, rc_period, warm_up=WARM_UP):
+    '''
+    Create a canonical hash of an experiment's parameters, run length and
+    warm-up period.
+
+    Params:
+    ------
+    experiment: Experiment or ExperimentSpec
+        A model experiment.  Must have a `parameters()` method.
+
+    rc_period: float
+        Model run length
+
+    warm_up: float, optional (default=WARM_UP)
+        Length of the warm-up period
+
+    Returns:
+    --------
+    str
+    '''
+    key = json.dumps(experiment_description(experiment, rc_period, warm_up),
+                     sort_keys=True, default=str)
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+class ResultsCache():
+    '''
+    Thread safe least recently used (LRU) cache of replication results.
+
+    Note that when an experiment has no random number set (seed=None) a 
+    cached result is a previous random sample of the same scenario.
+    '''
+    def __init__(self, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES):
+        '''
+        Constructor
+
+        Params:
+        ------
+        max_entries: int, optional (default=MAX_ENTRIES)
+            Maximum number of results to store.
+
+        max_bytes: int, optional (default=MAX_BYTES)
+            Maximum memory used by the stored results.
+        '''
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._descriptions = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        '''
+        Return a copy of the cached results or None if the key is not
+        in the cache.
+
+        Params:
+        ------
+        key: str
+            Key created by `experiment_key`
+
+        Returns:
+        -------
+        pandas.DataFrame or None
+        '''
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key].copy()
+
+    def put(self, key, results, description=None):
+        '''
+        Store results and evict the least recently used results if the
+        cache is full.
+
+        Params:
+        ------
+        key: str
+            Key created by `experiment_key`
+
+        results: pandas.DataFrame
+            Replication results.
+
+        description: dict, optional (default=None)
+            The experiment the results are from (see 
+            `experiment_description`).  Returned by `entries()`.
+        '''
+        results = results.copy()
+        with self._lock:
+            self._put(key, results, description)
+
+    def put_if_longer(self, key, results, description=None):
+        '''
+        Store results unless the cache already holds at least as many 
+        replications for the key.  The check and store are atomic, so 
+        concurrent runs of an experiment never replace longer results 
+        with shorter ones.
+
+        Params:
+        ------
+        key: str
+            Key created by `experiment_key`
+
+        results: pandas.DataFrame
+            Replication results.
+
+        description: dict, optional (default=None)
+            The experiment the results are from.
+
+        Returns:
+        -------
+        bool
+            True if the results were stored.
+        '''
+        results = results.copy()
+        with self._lock:
+            if key in self._entries and \
+                    len(self._entries[key]) >= len(results):
+                return False
+            self._put(key, results, description)
+            return True
+
+    def _put(self, key, results, description):
+        '''
+        Store results and evict entries if the cache is full (lock must be
+        held).
+        '''
+        nbytes = int(results.memory_usage(deep=True).sum())
+        if key in self._entries:
+            description = description or self._descriptions.get(key)
+            self._remove(key)
+        self._entries[key] = results
+        if description is not None:
+            self._descriptions[key] = description
+        self.nbytes += nbytes
+        while len(self._entries) > 1 and \
+            (len(self._entries) > self.max_entries 
+             or self.nbytes > self.max_bytes):
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        '''
+        Remove an entry (lock must be held).
+        '''
+        results = self._entries.pop(key)
+        self._descriptions.pop(key, None)
+        self.nbytes -= int(results.memory_usage(deep=True).sum())
+
+    def clear(self):
+        '''
+        Remove all results from the cache.
+        '''
+        with self._lock:
+            self._entries.clear()
+            self._descriptions.clear()
+            self.nbytes = 0
+
+    def entries(self):
+        '''
+        The cached results that have a description e.g. to fit a 
+        metamodel.  Does not change the order of eviction.
+
+        Returns:
+        -------
+        list of tuple (str, dict, pandas.DataFrame)
+            key, description and a copy of the results.
+        '''
+        with self._lock:
+            return [(key, self._descriptions[key], results.copy())
+                    for key, results in self._entries.items()
+                    if key in self._descriptions]
+
+    def get_or_run(self, experiment, rc_period, n_reps, run, 
+                   warm_up=WARM_UP, **kwargs):
+        '''
+        Return results for an experiment.  Cached replications are reused
+        and only the missing replications are run.  These are appended to
+        the cached results.
+
+        Params:
+        ------
+        experiment: Experiment
+            The experiment to run
+
+        rc_period: float
+            Model run length
+
+        n_reps: int
+            Number of replications
+
+        run: callable
+            Function to run the model e.g. `multiple_replications`. Called
+            as run(experiment, rc_period, n_reps, start_rep=start_rep, 
+            warm_up=warm_up, **kwargs)
+
+        warm_up: float, optional (default=WARM_UP)
+            Length of the warm-up period of each replication.  Part of the
+            cache key.
+
+        **kwargs: 
+            passed to `run`.  These are not part of the cache key so must
+            not change the results e.g. `n_jobs`.
+
+        Returns:
+        -------
+        pandas.DataFrame
+        '''
+        key = experiment_key(experiment, rc_period, warm_up)
+        description = experiment_description(experiment, rc_period, warm_up)
+        results = self.get(key)
+        if results is None:
+            results = run(experiment, rc_period, n_reps, start_rep=0, 
+                          warm_up=warm_up, **kwargs)
+            self.put(key, results, description)
+        elif len(results) < n_reps:
+            start_rep = len(results)
+            new_results = run(experiment, rc_period, n_reps - start_rep, 
+                              start_rep=start_rep, warm_up=warm_up, 
+                              **kwargs)
+            results = pd.concat([results, new_results])
+            self.put(key, results, description)
+        return results.iloc[:n_reps]
@@ -0,0 +1,272 @@
+'''
+Staffing optimisation for the 111 call centre model.
+
+Finds the cheapest combination of call operators and nurses that keeps the
+expected waiting times below target values.  Candidate staffing levels are
+evaluated in order of increasing cost, so the first feasible candidate is
+the cheapest.  Compute is saved in three ways:
+
+1. Sequential feasibility checks: each candidate runs replications in
+   batches only until the confidence interval of every KPI is clearly
+   below a target, or one is clearly above it.
+2. Monotonicity: adding resources never increases waiting times.  When a
+   candidate fails a target, all candidates with no more of the resources
+   that KPI depends on are pruned without being simulated.
+3. Common random numbers: every candidate uses the same random number
+   streams, so candidates are compared under the same arrivals and
+   service times.
+
+Usage:
+
+    best, candidates = optimise_staffing(Experiment(),
+                                         {'01_mean_waiting_time': 3.0,
+                                          '03_mean_nurse_waiting_time': 30.0})
+'''
+from dataclasses import replace
+
+import numpy as np
+import pandas as pd
+
+import model
+from output_analysis import OnlineStatistics, ALPHA
+
+# default waiting time targets (minutes)
+TARGETS = {'01_mean_waiting_time': 3.0,
+           '03_mean_nurse_waiting_time': 30.0}
+
+# default staffing ranges searched
+OPERATORS = range(10, 21)
+NURSES = range(6, 16)
+
+# default cost of each operator and nurse
+OPERATOR_COST = 1.0
+NURSE_COST = 1.0
+
+# resources each KPI depends on.  Operator waiting times are unaffected by
+# the number of nurses (nurse callbacks happen after the operator call).
+# KPIs not listed depend on both resources.
+DEPENDS_ON = {'01_mean_waiting_time': ('n_operators',),
+              '02_operator_util': ('n_operators',)}
+
+# default replications used to check the feasibility of a candidate
+MIN_REPS = 5
+MAX_REPS = 50
+BATCH_SIZE = 5
+
+
+def check_feasibility(experiment, targets, rc_period, min_reps=MIN_REPS,
+                      max_reps=MAX_REPS, batch_size=BATCH_SIZE,
+                      alpha=ALPHA, engine='fast', n_jobs=1, executor=None,
+                      warm_up=model.WARM_UP):
+    '''
+    Decide if the mean of each KPI of an experiment is below its target.
+
+    Replications are run in batches until every KPI's confidence interval
+    is below its target or at least one is above.  If the decision is
+    still unclear after `max_reps` the sample means are used.
+
+    Params:
+    ------
+    experiment: Experiment or ExperimentSpec
+        The experiment to check
+
+    targets: dict
+        Maximum mean value of each KPI e.g. {'01_mean_waiting_time': 3.0}
+
+    rc_period: float
+        Run length of each replication
+
+    min_reps: int, optional (default=MIN_REPS)
+        Minimum number of replications.
+
+    max_reps: int, optional (default=MAX_REPS)
+        Maximum number of replications.
+
+    batch_size: int, optional (default=BATCH_SIZE)
+        Number of replications run between checks.
+
+    alpha: float, optional (default=ALPHA)
+        Significance level of the confidence intervals.
+
+    engine: str, optional (default='fast')
+        The model engine used by `single_run`: 'simpy' or 'fast'.
+
+    n_jobs: int, optional (default=1)
+        Number of worker processes.  If no executor is provided and n_jobs
+        is not 1 a single pool is created for all batches.
+
+    executor: concurrent.futures.Executor, optional (default=None)
+        An existing executor to run the replications.
+
+    warm_up: float, optional (default=WARM_UP)
+        Length of the warm-up period of each replication.
+
+    Returns:
+    --------
+    dict
+        feasible, failed (KPIs above target), decided_by ('ci' or
+        'max_reps'), replications and the mean and half width of each
+        target KPI.
+    '''
+    stats = {kpi: OnlineStatistics() for kpi in targets}
+    n_reps = 0
+    decided_by = 'max_reps'
+
+    # a single pool of worker processes is shared by all batches
+    own_executor = executor is None and n_jobs != 1
+    if own_executor:
+        executor = model.create_executor(n_jobs)
+
+    try:
+        while n_reps < max_reps:
+            n_batch = max(batch_size, min_reps - n_reps)
+            n_batch = min(n_batch, max_reps - n_reps)
+            for _, rep_results in model.iter_replications(
+                    experiment, rc_period, n_batch, n_jobs, executor, engine,
+                    n_reps, warm_up):
+                for kpi in targets:
+                    stats[kpi].update(rep_results[kpi])
+            n_reps += n_batch
+
+            if n_reps < min_reps:
+                continue
+            above = [kpi for kpi, target in targets.items()
+                     if stats[kpi].mean - stats[kpi].half_width(alpha)
+                     > target]
+            below = [kpi for kpi, target in targets.items()
+                     if stats[kpi].mean + stats[kpi].half_width(alpha)
+                     <= target]
+            if above or len(below) == len(targets):
+                decided_by = 'ci'
+                break
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+    if decided_by == 'ci':
+        failed = above
+    else:
+        failed = [kpi for kpi, target in targets.items()
+                  if stats[kpi].mean > target]
+
+    result = {'feasible': not failed, 'failed': failed,
+              'decided_by': decided_by, 'replications': n_reps}
+    for kpi, kpi_stats in stats.items():
+        result[f'{kpi}_mean'] = kpi_stats.mean
+        result[f'{kpi}_half_width'] = kpi_stats.half_width(alpha)
+    return result
+
+
+def _dominated(candidate, failures):
+    '''
+    Is a candidate known to fail a target because a candidate with at
+    least as many of the relevant resources failed it?
+    '''
+    for failed, kpis in failures:
+        for kpi in kpis:
+            resources = DEPENDS_ON.get(kpi, ('n_operators', 'n_nurses'))
+            if all(candidate[name] <= failed[name] for name in resources):
+                return True
+    return False
+
+
+def optimise_staffing(experiment, targets=TARGETS, operators=OPERATORS,
+                      nurses=NURSES, operator_cost=OPERATOR_COST,
+                      nurse_cost=NURSE_COST,
+                      rc_period=model.RESULTS_COLLECTION_PERIOD,
+                      min_reps=MIN_REPS, max_reps=MAX_REPS,
+                      batch_size=BATCH_SIZE, alpha=ALPHA, engine='fast',
+                      n_jobs=1, executor=None, warm_up=model.WARM_UP):
+    '''
+    Find the cheapest number of operators and nurses that keeps the mean
+    of each KPI below its target.
+
+    Params:
+    ------
+    experiment: Experiment or ExperimentSpec
+        Experiment with the demand and service parameters.  Its staffing
+        levels are ignored.  If it has no random number set one is chosen
+        so that all candidates use common random numbers.
+
+    targets: dict, optional (default=TARGETS)
+        Maximum mean value of each KPI.
+
+    operators: iterable, optional (default=OPERATORS)
+        Numbers of operators to search.
+
+    nurses: iterable, optional (default=NURSES)
+        Numbers of nurses to search.
+
+    operator_cost: float, optional (default=OPERATOR_COST)
+        Cost of each operator.
+
+    nurse_cost: float, optional (default=NURSE_COST)
+        Cost of each nurse.
+
+    rc_period: float, optional (default=RESULTS_COLLECTION_PERIOD)
+        Run length of each replication.
+
+    min_reps, max_reps, batch_size, alpha, engine, n_jobs, executor,
+    warm_up:
+        Passed to `check_feasibility`.  If no executor is provided and
+        n_jobs is not 1 a single pool is created for all candidates.
+
+    Returns:
+    --------
+    tuple (dict, pandas.DataFrame)
+        The cheapest feasible staffing (n_operators, n_nurses and cost) or
+        None if no candidate is feasible, and every candidate's status:
+        'feasible', 'infeasible', 'pruned' or 'not_evaluated'.
+    '''
+    spec = model.experiment_spec(experiment)
+    if spec.random_number_set is None:
+        spec = replace(spec,
+                       random_number_set=np.random.SeedSequence().entropy)
+
+    candidates = [{'n_operators': n_operators, 'n_nurses': n_nurses,
+                   'cost': n_operators * operator_cost
+                           + n_nurses * nurse_cost}
+                  for n_operators in operators for n_nurses in nurses]
+    candidates.sort(key=lambda c: (c['cost'], c['n_operators'],
+                                   c['n_nurses']))
+
+    best = None
+    failures = []
+    own_executor = executor is None and n_jobs != 1
+    if own_executor:
+        executor = model.create_executor(n_jobs)
+
+    try:
+        for candidate in candidates:
+            if best is not None:
+                candidate['status'] = 'not_evaluated'
+                continue
+            if _dominated(candidate, failures):
+                candidate['status'] = 'pruned'
+                continue
+
+            result = check_feasibility(
+                replace(spec, n_operators=candidate['n_operators'],
+                        n_nurses=candidate['n_nurses']),
+                targets, rc_period, min_reps, max_reps, batch_size, alpha,
+                engine, n_jobs, executor, warm_up)
+            candidate.update(result)
+
+            if result['feasible']:
+                candidate['status'] = 'feasible'
+                best = {'n_operators': candidate['n_operators'],
+                        'n_nurses': candidate['n_nurses'],
+                        'cost': candidate['cost']}
+            else:
+                candidate['status'] = 'infeasible'
+                failures.append((candidate, result['failed']))
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+    df_candidates = pd.DataFrame(candidates)
+    if 'replications' not in df_candidates:
+        df_candidates['replications'] = 0
+    df_candidates['replications'] = \
+        df_candidates['replications'].fillna(0).astype(int)
+    return best, df_candidates
@@ -0,0 +1,129 @@
+'''
+Tests of the background job queue: requests for the same experiment share
+a job, cancellation stops a job between replications and completed
+replications are reused from the cache.
+
+Run from this directory with:
+
+    python -m pytest -q test_jobs.py
+'''
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+import model
+from backends import get_backend
+from jobs import CANCELLED, DONE, JobQueue
+
+RC_PERIOD = 300.0
+TIMEOUT = 10.0
+
+
+class GatedBackend():
+    '''
+    A backend that runs one (dummy) replication each time the gate is
+    released so a test controls the progress of a job.
+    '''
+    def __init__(self):
+        self.gate = threading.Semaphore(0)
+
+    def iter_replications(self, experiment, rc_period, n_reps, n_jobs=1,
+                          executor=None, start_rep=0, warm_up=0.0):
+        for rep in range(start_rep, start_rep + n_reps):
+            if not self.gate.acquire(timeout=TIMEOUT):
+                raise TimeoutError('replication not released')
+            yield rep + 1, {'kpi': float(rep)}
+
+
+def wait_for(condition):
+    deadline = time.monotonic() + TIMEOUT
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def queue():
+    queue = JobQueue()
+    yield queue
+    queue.shutdown()
+
+
+def test_duplicate_submit_shares_job(queue):
+    backend = GatedBackend()
+    spec = model.ExperimentSpec(random_number_set=1)
+    job = queue.submit(backend, spec, RC_PERIOD, 3)
+    assert queue.submit(backend, spec, RC_PERIOD, 3) is job
+
+    # a smaller request is served by the same job
+    assert queue.submit(backend, spec, RC_PERIOD, 2) is job
+    assert job.n_reps == 3
+
+    for _ in range(3):
+        backend.gate.release()
+    assert job.wait(TIMEOUT)
+    assert job.status == DONE
+    assert len(job.results()) == 3
+
+
+def test_larger_request_extends_job(queue):
+    backend = GatedBackend()
+    spec = model.ExperimentSpec(random_number_set=1)
+    job = queue.submit(backend, spec, RC_PERIOD, 2)
+    backend.gate.release()
+    wait_for(lambda: job.n_complete == 1)
+
+    assert queue.submit(backend, spec, RC_PERIOD, 5) is job
+    assert job.n_reps == 5
+    for _ in range(4):
+        backend.gate.release()
+    assert job.wait(TIMEOUT)
+    assert list(job.results().index) == [1, 2, 3, 4, 5]
+    assert len(queue.cache.get(job.key)) == 5
+
+
+def test_cancel_stops_between_replications(queue):
+    backend = GatedBackend()
+    spec = model.ExperimentSpec(random_number_set=1)
+    job = queue.submit(backend, spec, RC_PERIOD, 100)
+    for _ in range(2):
+        backend.gate.release()
+    wait_for(lambda: job.n_complete == 2)
+
+    job.cancel()
+    # the replication in progress completes, no more are started
+    backend.gate.release()
+    assert job.wait(TIMEOUT)
+    assert job.status == CANCELLED
+    assert job.n_complete == 3
+    assert len(queue.cache.get(job.key)) == 3
+    assert queue.jobs() == []
+
+
+def test_job_runs_until_all_requests_cancel(queue):
+    backend = GatedBackend()
+    spec = model.ExperimentSpec(random_number_set=1)
+    job = queue.submit(backend, spec, RC_PERIOD, 2)
+    queue.submit(backend, spec, RC_PERIOD, 2).cancel()
+
+    for _ in range(2):
+        backend.gate.release()
+    assert job.wait(TIMEOUT)
+    assert job.status == DONE
+
+
+def test_results_match_and_are_cached(queue):
+    backend = get_backend('fast')
+    spec = model.ExperimentSpec(random_number_set=3)
+    job = queue.submit(backend, spec, RC_PERIOD, 4)
+    assert job.wait(TIMEOUT)
+    expected = model.multiple_replications(spec, RC_PERIOD, 4, engine='fast')
+    pd.testing.assert_frame_equal(job.results(), expected,
+                                  check_names=False)
+
+    # a repeated request is served from the cache
+    cached = queue.submit(backend, spec, RC_PERIOD, 4)
+    assert cached is not job
+    assert cached.finished and cached.status == DONE
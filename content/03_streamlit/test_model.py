@@ -0,0 +1,186 @@
+'''
+Tests of the 111 call centre model.
+
+Replications must be reproducible: replication i uses the same random
+number streams however replications are run (serial, worker processes or
+threads) and whichever replication a run starts from.
+
+Given the same random number streams the fast engine (`fast_model`) must
+reproduce the simpy model: the KPIs of each replication and the event log
+of each caller should match to rounding.  Under independent streams the
+mean KPIs of the two engines should agree within confidence intervals.
+
+Run from this directory with:
+
+    python -m pytest -q test_model.py
+'''
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import stats
+
+import model
+
+# short runs keep the tests fast
+RC_PERIOD = 300.0
+WARM_UP = 100.0
+N_REPS = 20
+
+# significance level of the replication level check
+ALPHA = 0.01
+
+SCENARIOS = [{},
+             {'n_operators': 11, 'n_nurses': 6},
+             {'n_operators': 16, 'chance_callback': 0.8}]
+
+
+@pytest.mark.parametrize('engine', ['simpy', 'fast'])
+def test_replications_independent_of_workers(engine):
+    spec = model.ExperimentSpec(random_number_set=11)
+    serial = model.multiple_replications(spec, RC_PERIOD, 4, n_jobs=1,
+                                         engine=engine)
+    processes = model.multiple_replications(spec, RC_PERIOD, 4, n_jobs=2,
+                                            engine=engine)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        threads = model.multiple_replications(spec, RC_PERIOD, 4,
+                                              executor=executor,
+                                              engine=engine)
+    pd.testing.assert_frame_equal(serial, processes)
+    pd.testing.assert_frame_equal(serial, threads)
+
+
+def test_experiment_and_spec_replications_match():
+    experiment = model.Experiment(random_number_set=11)
+    from_experiment = model.multiple_replications(experiment, RC_PERIOD, 3)
+    from_spec = model.multiple_replications(experiment.spec(), RC_PERIOD, 3)
+    pd.testing.assert_frame_equal(from_experiment, from_spec)
+
+
+@pytest.mark.parametrize('start_rep', [1, 3])
+def test_start_rep_reproduces_replications(start_rep):
+    spec = model.ExperimentSpec(random_number_set=11)
+    full = model.multiple_replications(spec, RC_PERIOD, 5)
+    rest = model.multiple_replications(spec, RC_PERIOD, 5 - start_rep,
+                                       start_rep=start_rep)
+    pd.testing.assert_frame_equal(full.iloc[start_rep:], rest)
+
+
+def run_both(spec, rep, warm_up=0.0):
+    '''
+    Run a replication with each engine.  Returns the simpy and fast KPIs.
+    '''
+    simpy_results = model.single_run(spec, RC_PERIOD, rep, 'simpy', warm_up)
+    fast_results = model.single_run(spec, RC_PERIOD, rep, 'fast', warm_up)
+    return simpy_results, fast_results
+
+
+def assert_kpis_match(simpy_results, fast_results):
+    assert simpy_results.keys() == fast_results.keys()
+    for kpi, value in simpy_results.items():
+        assert np.allclose(value, fast_results[kpi]), kpi
+
+
+@pytest.mark.parametrize('params', SCENARIOS)
+@pytest.mark.parametrize('rep', [0, 3])
+def test_single_run_matches(params, rep):
+    spec = model.ExperimentSpec(random_number_set=7, **params)
+    assert_kpis_match(*run_both(spec, rep))
+
+
+def test_float_staffing_matches():
+    # staffing read from a csv file is float e.g. 13.0
+    spec = model.ExperimentSpec(random_number_set=7, n_operators=13.0,
+                                n_nurses=9.0)
+    assert_kpis_match(*run_both(spec, 0))
+
+    experiment = model.Experiment(random_number_set=7, n_operators=13.0,
+                                  n_nurses=9.0)
+    results = model.multiple_replications(experiment, RC_PERIOD, 2,
+                                          engine='fast')
+    assert len(results) == 2
+
+
+@pytest.mark.parametrize('params', SCENARIOS)
+def test_single_run_matches_with_warm_up(params):
+    spec = model.ExperimentSpec(random_number_set=7, **params)
+    assert_kpis_match(*run_both(spec, 1, WARM_UP))
+
+
+@pytest.mark.parametrize('warm_up', [0.0, WARM_UP])
+def test_monitored_resources_match(warm_up):
+    spec = model.ExperimentSpec(random_number_set=7, monitor_resources=True)
+    simpy_results, fast_results = run_both(spec, 2, warm_up)
+    assert '05_mean_operator_queue' in simpy_results
+    assert_kpis_match(simpy_results, fast_results)
+
+
+@pytest.mark.parametrize('warm_up', [0.0, WARM_UP])
+def test_event_logs_match(warm_up):
+    logs = []
+    for engine in ('simpy', 'fast'):
+        experiment = model.Experiment(random_number_set=7, log_callers=True)
+        model.single_run(experiment, RC_PERIOD, 0, engine, warm_up)
+        log = experiment.results['event_log'].to_frame()
+        logs.append(log.sort_values('caller').reset_index(drop=True))
+
+    simpy_log, fast_log = logs
+    assert len(simpy_log) > 0
+    pd.testing.assert_frame_equal(simpy_log, fast_log, check_exact=False)
+
+
+def test_replication_means_agree():
+    # independent streams: the engines should not be distinguishable
+    simpy_results = model.multiple_replications(
+        model.ExperimentSpec(random_number_set=1), RC_PERIOD, N_REPS,
+        engine='simpy')
+    fast_results = model.multiple_replications(
+        model.ExperimentSpec(random_number_set=2), RC_PERIOD, N_REPS,
+        engine='fast')
+
+    for kpi in simpy_results.columns:
+        difference = simpy_results[kpi].mean() - fast_results[kpi].mean()
+        std_error = np.sqrt(simpy_results[kpi].var() / N_REPS
+                            + fast_results[kpi].var() / N_REPS)
+        t_value = stats.t.ppf(1 - ALPHA / 2, 2 * N_REPS - 2)
+        assert abs(difference) <= t_value * std_error, kpi
+
+
+def test_precision_ignores_nan_kpis():
+    # runs are too short for any nurse calls: the nurse waiting time is nan
+    spec = model.ExperimentSpec(random_number_set=2)
+    results, precision = model.replications_until_precision(
+        spec, rc_period=6.0, max_reps=100, engine='fast')
+    assert results['03_mean_nurse_waiting_time'].isna().all()
+    assert len(results) < 100
+    assert not precision.loc['03_mean_nurse_waiting_time', 'target_met']
+
+
+def test_select_warm_up():
+    experiment = model.Experiment(random_number_set=1)
+    warm_up = model.select_warm_up(experiment)
+    assert 0.0 <= warm_up <= model.PILOT_PERIOD / 2
+    assert warm_up % model.PILOT_INTERVAL == 0.0
+    assert not experiment.log_callers
+
+
+def test_spec_round_trip():
+    spec = model.ExperimentSpec(n_operators=11, n_nurses=7, mean_iat=0.5,
+                                chance_callback=0.3, random_number_set=9,
+                                buffered=True, block_size=64,
+                                store_samples=True, quantiles=(0.5,),
+                                log_callers=True, monitor_resources=True)
+    assert spec.create_context().spec() == spec
+
+
+def test_spec_shared_by_threads():
+    # one spec run concurrently from several threads gives the serial
+    # results
+    spec = model.ExperimentSpec(random_number_set=13, monitor_resources=True)
+    reps = [0, 1, 2, 3] * 4
+    serial = [model.single_run(spec, RC_PERIOD, rep) for rep in reps]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        threaded = list(executor.map(
+            lambda rep: model.single_run(spec, RC_PERIOD, rep), reps))
+    assert threaded == serial
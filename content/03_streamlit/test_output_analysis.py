@@ -0,0 +1,107 @@
+'''
+Tests of the streaming output analysis tools against numpy on a fixed
+sample.
+
+Run from this directory with:
+
+    python -m pytest -q test_output_analysis.py
+'''
+import numpy as np
+import pytest
+
+from output_analysis import OnlineStatistics, P2Quantile, SampleStatistics
+
+SAMPLE = np.random.default_rng(42).exponential(scale=3.0, size=20_000)
+
+
+def test_online_statistics_match_numpy():
+    stats = OnlineStatistics()
+    for x in SAMPLE:
+        stats.update(x)
+    assert stats.n == len(SAMPLE)
+    assert np.isclose(stats.mean, SAMPLE.mean())
+    assert np.isclose(stats.variance, SAMPLE.var(ddof=1))
+    assert stats.min == SAMPLE.min()
+    assert stats.max == SAMPLE.max()
+
+
+def test_extend_matches_single_pass():
+    single = OnlineStatistics()
+    for x in SAMPLE:
+        single.update(x)
+
+    extended = OnlineStatistics()
+    half = len(SAMPLE) // 2
+    for x in SAMPLE[:half]:
+        extended.update(x)
+    extended.extend(SAMPLE[half:])
+    assert extended.n == single.n
+    assert np.isclose(extended.mean, single.mean)
+    assert np.isclose(extended.variance, single.variance)
+
+
+def test_merge_of_halves_matches_single_pass():
+    single = OnlineStatistics()
+    single.extend(SAMPLE)
+
+    first, second = OnlineStatistics(), OnlineStatistics()
+    half = len(SAMPLE) // 3
+    first.extend(SAMPLE[:half])
+    second.extend(SAMPLE[half:])
+    first.merge(second)
+    assert first.n == single.n
+    assert np.isclose(first.mean, single.mean)
+    assert np.isclose(first.variance, single.variance)
+    assert first.min == single.min
+    assert first.max == single.max
+
+
+def test_merge_empty():
+    stats = OnlineStatistics()
+    stats.merge(OnlineStatistics())
+    assert stats.n == 0
+    assert np.isnan(stats.mean)
+
+    other = OnlineStatistics()
+    other.extend(SAMPLE[:10])
+    stats.merge(other)
+    assert np.isclose(stats.mean, SAMPLE[:10].mean())
+
+
+def test_merge_with_quantiles_raises():
+    with pytest.raises(ValueError):
+        OnlineStatistics((0.5,)).merge(OnlineStatistics())
+
+
+def test_sample_statistics_merge():
+    first, second = SampleStatistics(), SampleStatistics()
+    first.extend(SAMPLE[:100])
+    second.extend(SAMPLE[100:200])
+    first.merge(second)
+    assert len(first.samples) == 200
+    assert np.isclose(first.quantile(0.9), np.quantile(SAMPLE[:200], 0.9))
+
+
+@pytest.mark.parametrize('p', [0.1, 0.5, 0.9, 0.99])
+def test_p2_quantile_close_to_numpy(p):
+    estimator = P2Quantile(p)
+    for x in SAMPLE:
+        estimator.update(x)
+    exact = np.quantile(SAMPLE, p)
+    assert abs(estimator.value - exact) / exact < 0.02
+
+
+def test_p2_quantile_small_samples_exact():
+    estimator = P2Quantile(0.5)
+    assert np.isnan(estimator.value)
+    for x in SAMPLE[:5]:
+        estimator.update(x)
+    assert estimator.value == np.quantile(SAMPLE[:5], 0.5)
+
+
+def test_online_statistics_quantiles():
+    stats = OnlineStatistics(quantiles=(0.5, 0.9))
+    stats.extend(SAMPLE)
+    for p in (0.5, 0.9):
+        exact = np.quantile(SAMPLE, p)
+        assert abs(stats.quantile(p) - exact) / exact < 0.02
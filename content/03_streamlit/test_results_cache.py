@@ -0,0 +1,95 @@
+'''
+Tests of the results cache: least recently used eviction, the memory cap
+and incremental extension of cached replications.
+
+Run from this directory with:
+
+    python -m pytest -q test_results_cache.py
+'''
+import pandas as pd
+
+import model
+from results_cache import ResultsCache, experiment_key
+
+RC_PERIOD = 300.0
+
+
+def results_frame(n_reps):
+    return pd.DataFrame({'kpi': [float(rep) for rep in range(n_reps)]},
+                        index=pd.RangeIndex(1, n_reps + 1, name='rep'))
+
+
+def test_evicts_least_recently_used():
+    cache = ResultsCache(max_entries=2)
+    cache.put('a', results_frame(2))
+    cache.put('b', results_frame(2))
+
+    # reading 'a' makes 'b' the least recently used
+    cache.get('a')
+    cache.put('c', results_frame(2))
+    assert 'a' in cache
+    assert 'b' not in cache
+    assert 'c' in cache
+    assert len(cache) == 2
+
+
+def test_evicts_to_memory_cap():
+    nbytes = int(results_frame(100).memory_usage(deep=True).sum())
+    cache = ResultsCache(max_bytes=int(2.5 * nbytes))
+    for key in ('a', 'b', 'c'):
+        cache.put(key, results_frame(100))
+    assert 'a' not in cache
+    assert len(cache) == 2
+    assert cache.nbytes <= cache.max_bytes
+
+
+def test_keeps_single_entry_over_memory_cap():
+    cache = ResultsCache(max_bytes=1)
+    cache.put('a', results_frame(10))
+    assert 'a' in cache
+
+
+def test_put_if_longer_never_shortens():
+    cache = ResultsCache()
+    assert cache.put_if_longer('a', results_frame(10))
+    assert not cache.put_if_longer('a', results_frame(5))
+    assert len(cache.get('a')) == 10
+    assert cache.put_if_longer('a', results_frame(12))
+    assert len(cache.get('a')) == 12
+
+
+def test_get_returns_copy():
+    cache = ResultsCache()
+    cache.put('a', results_frame(3))
+    results = cache.get('a')
+    results.loc[1, 'kpi'] = -1.0
+    assert cache.get('a').loc[1, 'kpi'] == 0.0
+
+
+def test_extension_matches_fresh_run():
+    cache = ResultsCache()
+    spec = model.ExperimentSpec(random_number_set=5)
+    first = cache.get_or_run(spec, RC_PERIOD, 3, model.multiple_replications,
+                             engine='fast')
+    extended = cache.get_or_run(spec, RC_PERIOD, 8,
+                                model.multiple_replications, engine='fast')
+    fresh = model.multiple_replications(spec, RC_PERIOD, 8, engine='fast')
+
+    assert len(first) == 3
+    pd.testing.assert_frame_equal(extended, fresh)
+    assert len(cache.get(experiment_key(spec, RC_PERIOD))) == 8
+
+    # a smaller request is served from the cache
+    pd.testing.assert_frame_equal(
+        cache.get_or_run(spec, RC_PERIOD, 4, model.multiple_replications,
+                         engine='fast'), fresh.iloc[:4])
+
+
+def test_warm_up_is_part_of_key():
+    cache = ResultsCache()
+    spec = model.ExperimentSpec(random_number_set=5)
+    cache.get_or_run(spec, RC_PERIOD, 2, model.multiple_replications,
+                     engine='fast')
+    cache.get_or_run(spec, RC_PERIOD, 2, model.multiple_replications,
+                     warm_up=100.0, engine='fast')
+    assert len(cache) == 2
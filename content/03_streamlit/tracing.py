@@ -0,0 +1,209 @@
+'''
+Structured tracing of events in the 111 call centre model.
+
+A `Tracer` is passed to a single run of the model
+(`model.single_run(tracer=...)`).  The model emits a `TraceEvent` (the
+simulation time, event name and a few fields) at each step of a caller's
+journey and the tracer hands it to one or more sinks.  Messages are only
+formatted by sinks that write text, and a run without a tracer does no
+formatting or tracing calls at all.
+
+Sinks:
+
+* `PrintSink`: print each event (the old TRACE behaviour)
+* `FileSink`: write text or JSON lines to a file
+* `LoggerSink`: pass each event to a `logging.Logger`
+* `RingBufferSink`: keep the most recent events in memory
+
+Usage:
+
+    buffer = RingBufferSink(maxlen=1000)
+    single_run(experiment, tracer=Tracer(buffer))
+    df = buffer.to_frame()
+'''
+import json
+import logging
+from collections import deque, namedtuple
+
+import pandas as pd
+
+# default number of events kept by a ring buffer
+RING_BUFFER_SIZE = 10_000
+
+# text of each event emitted by the model
+MESSAGES = {
+    'arrival': 'call arrives at: {time:.3f}',
+    'operator_answered': 'operator answered call {caller} at {time:.3f}',
+    'call_ended': 'call {caller} ended {time:.3f}; '
+                  + 'waiting time was {waiting_time:.3f}',
+    'nurse_callback': 'Patient {caller} waiting for nurse call back',
+    'nurse_answered': 'nurse called back patient {caller} at {time:.3f}',
+    'nurse_ended': 'nurse consultation for {caller} competed at {time:.3f}',
+    'warm_up_complete': 'warm-up complete at: {time:.3f}'
+}
+
+
+class TraceEvent(namedtuple('TraceEvent', ['time', 'event', 'fields'])):
+    '''
+    An event emitted by the model.  Formatted to text on demand.
+    '''
+    __slots__ = ()
+
+    def __str__(self):
+        template = MESSAGES.get(self.event)
+        if template is None:
+            return f'{self.event} at {self.time:.3f}: {self.fields}'
+        return template.format(time=self.time, **self.fields)
+
+    def to_dict(self):
+        '''
+        Return the event as a flat dict
+        '''
+        return {'time': self.time, 'event': self.event, **self.fields}
+
+
+class Tracer():
+    '''
+    Sends events emitted during a run of the model to one or more sinks.
+    '''
+    def __init__(self, *sinks, events=None):
+        '''
+        Constructor
+
+        Params:
+        ------
+        *sinks: objects with a write(event) method
+            Where events are sent e.g. RingBufferSink()
+
+        events: iterable, optional (default=None)
+            Names of the events to emit (see MESSAGES).  If None all
+            events are emitted.
+        '''
+        self.sinks = list(sinks)
+        self.events = None if events is None else frozenset(events)
+
+    def emit(self, event, time, **fields):
+        '''
+        Emit an event to all sinks.
+
+        Params:
+        ------
+        event: str
+            Name of the event e.g. 'arrival'
+
+        time: float
+            Simulation time of the event
+
+        **fields:
+            Event data e.g. caller=1
+        '''
+        if self.events is not None and event not in self.events:
+            return
+        trace_event = TraceEvent(time, event, fields)
+        for sink in self.sinks:
+            sink.write(trace_event)
+
+    def close(self):
+        '''
+        Close any sinks that hold resources e.g. files
+        '''
+        for sink in self.sinks:
+            if hasattr(sink, 'close'):
+                sink.close()
+
+
+class PrintSink():
+    '''
+    Print each event to screen.
+    '''
+    def write(self, event):
+        print(event)
+
+
+class FileSink():
+    '''
+    Write events to a file as text or JSON lines.
+    '''
+    def __init__(self, path, fmt='text'):
+        '''
+        Constructor
+
+        Params:
+        ------
+        path: str
+            File to write to (overwritten)
+
+        fmt: str, optional (default='text')
+            'text' writes the event message.  'json' writes one JSON
+            object per line.
+        '''
+        if fmt not in ('text', 'json'):
+            raise ValueError(f'Unknown format {fmt}. Use text or json.')
+        self.fmt = fmt
+        self.file = open(path, 'w')
+
+    def write(self, event):
+        if self.fmt == 'json':
+            self.file.write(json.dumps(event.to_dict()) + '\n')
+        else:
+            self.file.write(f'{event}\n')
+
+    def close(self):
+        self.file.close()
+
+
+class LoggerSink():
+    '''
+    Pass events to a logger.  Formatting is left to logging, so events are
+    only formatted if the logger is enabled for the level.
+    '''
+    def __init__(self, logger=None, level=logging.DEBUG):
+        '''
+        Constructor
+
+        Params:
+        ------
+        logger: logging.Logger, optional (default=None)
+            If None the logger of this module is used.
+
+        level: int, optional (default=logging.DEBUG)
+            Level events are logged at.
+        '''
+        self.logger = logging.getLogger(__name__) if logger is None \
+            else logger
+        self.level = level
+
+    def write(self, event):
+        self.logger.log(self.level, '%s', event)
+
+
+class RingBufferSink():
+    '''
+    Keep the most recent events in memory.
+    '''
+    def __init__(self, maxlen=RING_BUFFER_SIZE):
+        '''
+        Constructor
+
+        Params:
+        ------
+        maxlen: int, optional (default=RING_BUFFER_SIZE)
+            Maximum number of events held.  Older events are dropped.
+        '''
+        self.events = deque(maxlen=maxlen)
+
+    def write(self, event):
+        self.events.append(event)
+
+    def to_frame(self):
+        '''
+        Return the buffered events as a DataFrame with a column for the
+        time, event name and each field.
+
+        Returns:
+        -------
+        pandas.DataFrame
+        '''
+        if not self.events:
+            return pd.DataFrame(columns=['time', 'event'])
+        return pd.DataFrame([event.to_dict() for event in self.events])